@@ -1,6 +1,6 @@
 import os
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, Tuple
 
 from dotenv import load_dotenv
 
@@ -8,26 +8,39 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def _parse_urls(value: Optional[str]) -> Tuple[str, ...]:
+    # Several deployments of one function may be listed comma-separated.
+    return tuple(url.strip() for url in (value or "").split(",") if url.strip())
+
+
 @dataclass(frozen=True)
 class BotConfig:
     telegram_token: str
-    passport_url: str
-    audio_url: str
+    passport_urls: Tuple[str, ...]
+    audio_urls: Tuple[str, ...]
     log_level: str = "INFO"
 
+    @property
+    def passport_url(self) -> str:
+        return self.passport_urls[0]
+
+    @property
+    def audio_url(self) -> str:
+        return self.audio_urls[0]
+
     @staticmethod
     def from_env() -> "BotConfig":
         token = os.getenv("TELEGRAM_BOT_TOKEN")
-        passport_url = os.getenv("PASSPORT_FUNCTION_URL")
-        audio_url = os.getenv("AUDIO_FUNCTION_URL")
+        passport_urls = _parse_urls(os.getenv("PASSPORT_FUNCTION_URL"))
+        audio_urls = _parse_urls(os.getenv("AUDIO_FUNCTION_URL"))
         log_level = os.getenv("LOG_LEVEL", "INFO").upper()
 
         missing = [
             name
             for name, value in [
                 ("TELEGRAM_BOT_TOKEN", token),
-                ("PASSPORT_FUNCTION_URL", passport_url),
-                ("AUDIO_FUNCTION_URL", audio_url),
+                ("PASSPORT_FUNCTION_URL", passport_urls),
+                ("AUDIO_FUNCTION_URL", audio_urls),
             ]
             if not value
         ]
@@ -37,8 +50,8 @@ class BotConfig:
 
         return BotConfig(
             telegram_token=token,
-            passport_url=passport_url,
-            audio_url=audio_url,
+            passport_urls=passport_urls,
+            audio_urls=audio_urls,
             log_level=log_level,
         )
 
@@ -3,7 +3,7 @@ import json
 import logging
 from datetime import datetime, timezone
 from io import BytesIO
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Sequence
 
 import requests
 from telegram import ParseMode, Update
@@ -34,6 +34,21 @@ def reset_session(user_id: int) -> Session:
     return session
 
 
+def post_with_failover(urls: Sequence[str], payload: Dict[str, Any], timeout: int) -> requests.Response:
+    # Try each deployment in turn; only connection failures move on to the next one.
+    for index, url in enumerate(urls):
+        try:
+            response = requests.post(url, json=payload, timeout=timeout)
+        except requests.ConnectionError:
+            if index == len(urls) - 1:
+                raise
+            logging.warning("Function endpoint %s unreachable, trying next", url)
+            continue
+        response.raise_for_status()
+        return response
+    raise requests.ConnectionError("No function endpoints configured")
+
+
 def handle_start(update: Update, context: CallbackContext) -> None:
     user_id = update.effective_user.id
     reset_session(user_id)
@@ -92,12 +107,11 @@ def handle_photo(update: Update, context: CallbackContext) -> None:
     config: BotConfig = context.bot_data["config"]
 
     try:
-        response = requests.post(
-            config.passport_url,
-            json={"imageBase64": encoded_image},
+        response = post_with_failover(
+            config.passport_urls,
+            {"imageBase64": encoded_image},
             timeout=45,
         )
-        response.raise_for_status()
         payload = response.json()
         passport_data = payload.get("passportData", payload)
     except requests.RequestException as exc:
@@ -145,12 +159,11 @@ def handle_voice(update: Update, context: CallbackContext) -> None:
     config: BotConfig = context.bot_data["config"]
 
     try:
-        response = requests.post(
-            config.audio_url,
-            json={"audioBase64": encoded_audio},
+        response = post_with_failover(
+            config.audio_urls,
+            {"audioBase64": encoded_audio},
             timeout=60,
         )
-        response.raise_for_status()
         payload = response.json()
         audio_data = payload.get("audioData", payload)
     except requests.RequestException:
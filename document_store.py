@@ -0,0 +1,129 @@
+"""
+Сохранённые документы пользователей для повторных обращений.
+
+Пользователь, который уже распознавал паспорт или патент, может по своему
+желанию сохранить результат и в следующий раз сразу перейти к голосовому —
+без скачивания фото, OCR и GPT.
+
+Записи разделены по ботам (tenant): пользователь одного бота не видит
+документы, сохранённые в другом.
+
+Данные документа шифруются (Fernet из пакета cryptography) ключом из
+окружения и хранятся в SQLite с ограниченным сроком жизни. Без ключа или
+без пакета cryptography хранилище выключено и ничего не сохраняет.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:  # cryptography необязателен
+    Fernet = None
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentStore:
+    """Зашифрованное хранилище распознанных документов с истечением срока"""
+
+    def __init__(self, path: str, key: Optional[str], ttl: float) -> None:
+        self.ttl = ttl
+        self._fernet = None
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+        if not key:
+            return
+        if Fernet is None:
+            logger.warning("cryptography is not installed, saved documents are disabled")
+            return
+        try:
+            self._fernet = Fernet(key.encode())
+        except ValueError:
+            logger.error("Invalid document store key, saved documents are disabled")
+            return
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " tenant TEXT NOT NULL,"
+                " user_id INTEGER NOT NULL,"
+                " document_type TEXT NOT NULL,"
+                " payload BLOB NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " PRIMARY KEY (tenant, user_id, document_type))"
+            )
+        self.purge_expired()
+
+    @property
+    def enabled(self) -> bool:
+        return self._db is not None
+
+    def save(self, tenant: str, user_id: int, document_type: str, document_data: Dict[str, Any]) -> bool:
+        """Сохранить (или заменить) документ пользователя"""
+        if not self.enabled:
+            return False
+        payload = self._fernet.encrypt(json.dumps(document_data, ensure_ascii=False).encode())
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?)",
+                (tenant, user_id, document_type, payload, time.time() + self.ttl),
+            )
+        return True
+
+    def load(self, tenant: str, user_id: int, document_type: str) -> Optional[Dict[str, Any]]:
+        """Сохранённый документ или None, если его нет или срок истёк"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT payload FROM documents"
+                " WHERE tenant = ? AND user_id = ? AND document_type = ? AND expires_at > ?",
+                (tenant, user_id, document_type, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            return json.loads(self._fernet.decrypt(row[0]))
+        except (InvalidToken, ValueError):
+            # Запись зашифрована другим ключом или повреждена
+            logger.warning("Could not decrypt saved %s for user %s", document_type, user_id)
+            self.forget(tenant, user_id, document_type)
+            return None
+
+    def has(self, tenant: str, user_id: int, document_type: str) -> bool:
+        """Есть ли у пользователя действующий сохранённый документ этого типа"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM documents"
+                " WHERE tenant = ? AND user_id = ? AND document_type = ? AND expires_at > ?",
+                (tenant, user_id, document_type, time.time()),
+            ).fetchone()
+        return row is not None
+
+    def forget(self, tenant: str, user_id: int, document_type: Optional[str] = None) -> int:
+        """Удалить документы пользователя (все или одного типа); вернуть число удалённых"""
+        if not self.enabled:
+            return 0
+        query = "DELETE FROM documents WHERE tenant = ? AND user_id = ?"
+        params: List[Any] = [tenant, user_id]
+        if document_type:
+            query += " AND document_type = ?"
+            params.append(document_type)
+        with self._lock, self._db:
+            return self._db.execute(query, params).rowcount
+
+    def purge_expired(self) -> int:
+        """Удалить документы с истёкшим сроком"""
+        if not self.enabled:
+            return 0
+        with self._lock, self._db:
+            return self._db.execute("DELETE FROM documents WHERE expires_at <= ?", (time.time(),)).rowcount
@@ -0,0 +1,240 @@
+"""
+Маршрутизация запросов между несколькими развёртываниями функции.
+
+Для каждой функции (passport, license, patent, audio) задаётся список URL —
+например, разные регионы или версии. Запрос уходит на адрес с наименьшей
+оценкой EWMA(задержки) × (число запросов в работе + 1), поэтому медленный
+или перегруженный регион получает меньше трафика.
+
+Адрес, который несколько раз подряд не ответил (сетевая ошибка или 5xx),
+выводится из ротации и возвращается после успешной проверки здоровья.
+Список адресов перечитывается из JSON-файла при его изменении и по SIGHUP,
+без перезапуска бота.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Collection, Dict, Iterator, List, Optional
+
+import requests
+
+EWMA_ALPHA = 0.3
+FAILURE_THRESHOLD = 3
+FAILURE_PENALTY = 10.0  # задержка (сек), которой считается неудачный запрос
+HEALTH_CHECK_INTERVAL = 30.0
+HEALTH_CHECK_TIMEOUT = 5.0
+
+logger = logging.getLogger(__name__)
+
+
+class Endpoint:
+    """Адрес функции и его статистика"""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.outstanding = 0
+        self.ewma_latency: Optional[float] = None
+        self.consecutive_failures = 0
+        self.healthy = True
+
+    def score(self, prior: float) -> float:
+        # Адрес без статистики считается средним по пулу (prior), чтобы
+        # и на него действовал множитель числа запросов в работе
+        latency = self.ewma_latency if self.ewma_latency is not None else prior
+        return latency * (self.outstanding + 1)
+
+
+class EndpointPool:
+    """Набор адресов одной функции с выбором по нагрузке и задержке"""
+
+    def __init__(self, name: str, urls: List[str]) -> None:
+        self.name = name
+        self._lock = threading.Lock()
+        self._endpoints: List[Endpoint] = []
+        self.set_urls(urls)
+
+    @property
+    def urls(self) -> List[str]:
+        with self._lock:
+            return [endpoint.url for endpoint in self._endpoints]
+
+    def set_urls(self, urls: List[str]) -> None:
+        """Заменить список адресов, сохранив статистику оставшихся"""
+        with self._lock:
+            known = {endpoint.url: endpoint for endpoint in self._endpoints}
+            self._endpoints = [known.get(url) or Endpoint(url) for url in dict.fromkeys(urls)]
+
+    def _acquire(self, exclude: Collection[str]) -> Endpoint:
+        with self._lock:
+            if not self._endpoints:
+                raise RuntimeError(f"No endpoints configured for {self.name}")
+            # Если все адреса исключены или нездоровы, выбираем из оставшихся
+            candidates = [e for e in self._endpoints if e.url not in exclude] or self._endpoints
+            candidates = [e for e in candidates if e.healthy] or candidates
+            known = [e.ewma_latency for e in self._endpoints if e.ewma_latency is not None]
+            prior = sum(known) / len(known) if known else FAILURE_PENALTY
+            scores = [endpoint.score(prior) for endpoint in candidates]
+            best = min(scores)
+            endpoint = random.choice([e for e, score in zip(candidates, scores) if score == best])
+            endpoint.outstanding += 1
+            return endpoint
+
+    def _release(self, endpoint: Endpoint, latency: float, ok: bool) -> None:
+        with self._lock:
+            endpoint.outstanding -= 1
+            if ok:
+                endpoint.consecutive_failures = 0
+                endpoint.healthy = True
+            else:
+                endpoint.consecutive_failures += 1
+                # Быстрый отказ не должен делать адрес "самым быстрым"
+                latency = max(latency, FAILURE_PENALTY)
+                if endpoint.healthy and endpoint.consecutive_failures >= FAILURE_THRESHOLD:
+                    endpoint.healthy = False
+                    logger.warning("%s endpoint %s marked unhealthy", self.name, endpoint.url)
+            if endpoint.ewma_latency is None:
+                endpoint.ewma_latency = latency
+            else:
+                endpoint.ewma_latency += EWMA_ALPHA * (latency - endpoint.ewma_latency)
+
+    @contextmanager
+    def request(self, exclude: Collection[str] = ()) -> Iterator[str]:
+        """Выбрать адрес на время запроса и учесть задержку и исход"""
+        endpoint = self._acquire(exclude)
+        started = time.monotonic()
+        ok = True
+        try:
+            yield endpoint.url
+        except requests.HTTPError as exc:
+            # 4xx - ошибка запроса, а не адреса
+            ok = exc.response is not None and exc.response.status_code < 500
+            raise
+        except requests.RequestException:
+            ok = False
+            raise
+        finally:
+            self._release(endpoint, time.monotonic() - started, ok)
+
+    def check_health(self) -> None:
+        """Проверить адреса, выведенные из ротации"""
+        with self._lock:
+            unhealthy = [endpoint for endpoint in self._endpoints if not endpoint.healthy]
+        for endpoint in unhealthy:
+            try:
+                # Функции принимают только POST: любой ответ, кроме 5xx, значит "жив"
+                response = requests.get(endpoint.url, timeout=HEALTH_CHECK_TIMEOUT)
+                alive = response.status_code < 500
+            except requests.RequestException:
+                alive = False
+            if alive:
+                with self._lock:
+                    endpoint.healthy = True
+                    endpoint.consecutive_failures = 0
+                logger.info("%s endpoint %s is back", self.name, endpoint.url)
+
+    def stats(self) -> List[Dict[str, object]]:
+        """Состояние адресов для диагностики"""
+        with self._lock:
+            return [
+                {
+                    "url": endpoint.url,
+                    "healthy": endpoint.healthy,
+                    "outstanding": endpoint.outstanding,
+                    "ewma_latency": endpoint.ewma_latency,
+                }
+                for endpoint in self._endpoints
+            ]
+
+
+class EndpointRegistry:
+    """Пулы адресов всех функций с перечитыванием файла конфигурации"""
+
+    def __init__(self, defaults: Dict[str, List[str]], config_path: Optional[str] = None) -> None:
+        self.defaults = defaults
+        self.config_path = config_path
+        self._config_mtime: Optional[float] = None
+        self.pools = {name: EndpointPool(name, urls) for name, urls in defaults.items()}
+        self.reload()
+
+    def pool(self, name: str) -> EndpointPool:
+        return self.pools[name]
+
+    def reload(self) -> None:
+        """Перечитать файл адресов (JSON: {"passport": [url, ...] или url, ...})"""
+        if not self.config_path:
+            return
+        try:
+            mtime = os.path.getmtime(self.config_path)
+            with open(self.config_path, encoding="utf-8") as fh:
+                config = json.load(fh)
+        except (OSError, ValueError):
+            logger.exception("Could not read endpoints file %s", self.config_path)
+            return
+        self._config_mtime = mtime
+        if not isinstance(config, dict):
+            logger.error("Endpoints file %s must contain a JSON object", self.config_path)
+            return
+        for name, pool in self.pools.items():
+            if config.get(name) is None:
+                urls = self.defaults[name]
+            else:
+                urls = config_urls(config[name])
+                if urls is None:
+                    logger.error("Invalid %s endpoints in %s: %r, keeping %s",
+                                 name, self.config_path, config[name], ", ".join(pool.urls))
+                    continue
+            if urls != pool.urls:
+                pool.set_urls(urls)
+                logger.info("%s endpoints: %s", name, ", ".join(urls))
+
+    def _reload_if_changed(self) -> None:
+        if not self.config_path:
+            return
+        try:
+            mtime = os.path.getmtime(self.config_path)
+        except OSError:
+            return
+        if mtime != self._config_mtime:
+            self.reload()
+
+    def check(self) -> None:
+        """Перечитать изменившийся файл и проверить адреса вне ротации"""
+        self._reload_if_changed()
+        for pool in self.pools.values():
+            pool.check_health()
+
+
+def start_health_checks(registries: List[EndpointRegistry], interval: float = HEALTH_CHECK_INTERVAL) -> None:
+    """Один фоновый поток проверок для всех наборов адресов"""
+
+    def loop() -> None:
+        while True:
+            time.sleep(interval)
+            for registry in registries:
+                registry.check()
+
+    threading.Thread(target=loop, name="endpoint-health", daemon=True).start()
+
+
+def parse_urls(value: Optional[str]) -> List[str]:
+    """Список адресов из переменной окружения (через запятую)"""
+    return [url.strip() for url in (value or "").split(",") if url.strip()]
+
+
+def config_urls(value: object) -> Optional[List[str]]:
+    """
+    Список адресов из конфигурации: строка - один адрес, иначе непустой
+    список непустых строк. Для любого другого значения - None.
+    """
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list) or not value:
+        return None
+    if not all(isinstance(url, str) and url.strip() for url in value):
+        return None
+    return [url.strip() for url in value]
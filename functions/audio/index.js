@@ -1,4 +1,5 @@
 const axios = require("axios");
+const { createGptRouter, modelRoutes } = require("./gpt-routing");
 
 // ============================================================================
 // КОНСТАНТЫ И КОНФИГУРАЦИЯ
@@ -11,6 +12,16 @@ const GPT_ENDPOINT = "https://llm.api.cloud.yandex.net/foundationModels/v1/compl
 const MIN_AUDIO_SIZE = 0; // Убрать минимальный лимит для совместимости
 const MAX_AUDIO_SIZE = 4 * 1024 * 1024; // 4MB
 
+// Маршруты GPT (gpt-routing.js): лимиты токенов быстрой и большой модели
+const GPT_ROUTES = modelRoutes(60, 200);
+const MAX_FAST_ROUTE_CHARS = 300; // длинный текст не помещается в короткий бюджет
+
+// Потоковый режим: длина фрагмента для промежуточных результатов и
+// максимальное число фрагментов (длинные записи режутся крупнее)
+const STREAM_CHUNK_SECONDS = 4;
+const MAX_STREAM_CHUNKS = 8;
+const OPUS_SAMPLE_RATE = 48000;
+
 // ============================================================================
 // ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
 // ============================================================================
@@ -50,16 +61,20 @@ async function callSpeechToText(audioBuffer) {
 }
 
 /**
- * Вызывает Yandex GPT для извлечения структурированных данных
+ * Промпт для извлечения банка и телефона
  * @param {string} text - Распознанный текст
- * @returns {Promise<Object>} Объект с bank_name и phone_number
- * @throws {Error} При ошибке API
+ * @param {boolean} compact - Короткий промпт для быстрой модели
+ * @returns {string} Текст промпта
  */
-async function extractDataWithGPT(text) {
-  const apiKey = process.env.YANDEX_GPT_API_KEY;
-  const folderId = process.env.YANDEX_FOLDER_ID;
+function buildAudioPrompt(text, compact) {
+  if (compact) {
+    return `Извлеки из фразы название банка и телефон (ровно 10 цифр, без +7/8 и других символов). Верни ТОЛЬКО JSON:
+{"bank_name": "название банка или 'не указано'", "phone_number": "10 цифр или null"}
+
+Текст: "${text}"`;
+  }
 
-  const prompt = `Извлеки из текста:
+  return `Извлеки из текста:
 1. Название банка (только официальное название, например: "Сбербанк", "Тинькофф", "ВТБ", "Альфа-Банк")
 2. Номер телефона (ВСЕГДА возвращай ТОЛЬКО 10 цифр)
 
@@ -82,13 +97,26 @@ async function extractDataWithGPT(text) {
   "bank_name": "название банка или 'не указано'",
   "phone_number": "10 цифр или null"
 }`;
+}
+
+/**
+ * Вызывает Yandex GPT для извлечения структурированных данных
+ * @param {string} prompt - Промпт
+ * @param {string} routeName - Маршрут из GPT_ROUTES (модель и лимит токенов)
+ * @returns {Promise<Object>} Объект с bank_name и phone_number
+ * @throws {Error} При ошибке API или ответе без JSON
+ */
+async function callYandexGPT(prompt, routeName) {
+  const apiKey = process.env.YANDEX_GPT_API_KEY;
+  const folderId = process.env.YANDEX_FOLDER_ID;
+  const route = GPT_ROUTES[routeName];
 
   const payload = {
-    modelUri: `gpt://${folderId}/yandexgpt-lite`,
+    modelUri: `gpt://${folderId}/${route.model}`,
     completionOptions: {
       stream: false,
       temperature: 0.1,
-      maxTokens: 200,
+      maxTokens: route.maxTokens,
     },
     messages: [{ role: "user", text: prompt }],
   };
@@ -119,6 +147,22 @@ async function extractDataWithGPT(text) {
   }
 }
 
+/**
+ * Извлечение банка и телефона с выбором модели по тексту
+ * @param {string} text - Распознанный текст
+ * @returns {Promise<{data: Object, routing: Object}>} Данные и сведения о маршруте
+ * @throws {Error} При ошибке API
+ */
+async function extractDataWithGPT(text) {
+  // Телефон из 10 цифр обязателен; банк - если он упомянут в тексте
+  const isValid = (data) => {
+    const phone = String(data.phone_number || "").replace(/\D/g, "");
+    const bankFound = data.bank_name && data.bank_name !== "не указано";
+    return phone.length === 10 && (bankFound || !BANK_HINT.test(text));
+  };
+  return gptRouter.extract(text, buildAudioPrompt, isValid);
+}
+
 /**
  * Улучшенная функция для извлечения 10 цифр телефона (точная копия старого кода)
  * @param {string} text - Текст для поиска номера
@@ -191,10 +235,321 @@ function extractTenDigitPhone(text) {
   return null;
 }
 
+/**
+ * Итоговый ответ: проверка номера с fallback (как в старом коде)
+ * @param {string} rawText - Распознанный текст
+ * @param {Object} extracted - Данные от GPT
+ * @param {string|null} gptError - Ошибка GPT, если была
+ * @param {Object|null} gptRouting - Сведения о маршруте GPT
+ * @returns {Object} Тело успешного ответа
+ */
+function buildAudioResponse(rawText, extracted, gptError, gptRouting = null) {
+  let finalPhoneNumber = extracted.phone_number;
+
+  if (!finalPhoneNumber || finalPhoneNumber === "null") {
+    console.log("GPT не извлек номер, пробуем fallback...");
+    finalPhoneNumber = extractTenDigitPhone(rawText);
+  } else {
+    // Проверяем, что номер содержит 10 цифр
+    const digitsOnly = finalPhoneNumber.replace(/\D/g, "");
+    if (digitsOnly.length === 10) {
+      finalPhoneNumber = digitsOnly;
+    } else {
+      console.log("GPT вернул некорректный номер, пробуем fallback...");
+      finalPhoneNumber = extractTenDigitPhone(rawText);
+    }
+  }
+
+  return {
+    success: true,
+    bank_name: extracted.bank_name || "не указано",
+    phone_number: finalPhoneNumber,
+    raw_text: rawText,
+    processing_info: {
+      gpt_used: extracted.phone_number !== null,
+      gpt_error: gptError,
+      fallback_used: finalPhoneNumber !== null && extracted.phone_number === null,
+      gpt_routing: gptRouting,
+    },
+  };
+}
+
+// ============================================================================
+// МАРШРУТИЗАЦИЯ МОДЕЛЕЙ GPT
+// ============================================================================
+//
+// Выбор модели и статистика - в gpt-routing.js; здесь оценка текста
+// голосового.
+
+// Упоминание банка в тексте: слово "банк" или известное название
+const BANK_HINT = /банк|сбер|тинькоф|втб|альфа|газпром|райф|открыти|совком|почта|озон|яндекс/i;
+
+/**
+ * Оценка текста голосового: номер произнесен цифрами и назван банк.
+ * Номер словами, несколько номеров или длинная речь - сложный случай
+ * @param {string} text - Распознанный текст
+ * @returns {{score: number, flags: string[]}} Оценка 0..1 и причины снижения
+ */
+function assessTextQuality(text) {
+  const digits = text.replace(/\D/g, "").length;
+  const bank = BANK_HINT.test(text);
+
+  const flags = [];
+  if (digits < 10) flags.push("no_digits");
+  if (digits > 12) flags.push("many_digits");
+  if (!bank) flags.push("no_bank");
+  if (text.length > MAX_FAST_ROUTE_CHARS) flags.push("long");
+
+  const score = (digits >= 10 && digits <= 12 ? 0.6 : 0) + (bank ? 0.4 : 0);
+  return { score, flags };
+}
+
+const gptRouter = createGptRouter({
+  callModel: callYandexGPT,
+  assessTextQuality,
+  maxFastChars: MAX_FAST_ROUTE_CHARS,
+});
+
+// ============================================================================
+// ПОТОКОВОЕ РАСПОЗНАВАНИЕ
+// ============================================================================
+//
+// Поток распознавания - async iterable событий { text, final }, где text -
+// весь распознанный на данный момент текст. Источник подменяется через
+// setSttStreamFactory (или переменную STT_FAKE_TRANSCRIPT для локальных
+// проверок без SpeechKit).
+
+/**
+ * Разбор OGG на страницы
+ * @param {Buffer} buffer - Аудио в формате OGG
+ * @returns {Array<{data: Buffer, granule: number}>} Страницы и их granule position
+ */
+function splitOggPages(buffer) {
+  const pages = [];
+  let offset = 0;
+  while (offset + 27 <= buffer.length && buffer.toString("ascii", offset, offset + 4) === "OggS") {
+    const segments = buffer[offset + 26];
+    let bodySize = 0;
+    for (let i = 0; i < segments; i++) {
+      bodySize += buffer[offset + 27 + i];
+    }
+    const size = 27 + segments + bodySize;
+    pages.push({
+      data: buffer.slice(offset, offset + size),
+      granule: Number(buffer.readBigInt64LE(offset + 6)),
+    });
+    offset += size;
+  }
+  return pages;
+}
+
+/**
+ * Нарезка OGG/Opus на самостоятельные фрагменты по границам страниц.
+ * К каждому фрагменту добавляются заголовки OpusHead и OpusTags.
+ * @param {Buffer} buffer - Аудио в формате OGG/Opus
+ * @returns {Buffer[]} Фрагменты (один, если нарезать нечего)
+ */
+function chunkOggOpus(buffer) {
+  const pages = splitOggPages(buffer);
+  if (pages.length < 3) return [buffer];
+
+  const headers = pages.slice(0, 2).map((page) => page.data);
+  const duration = pages[pages.length - 1].granule / OPUS_SAMPLE_RATE;
+  const chunkSeconds = Math.max(STREAM_CHUNK_SECONDS, duration / MAX_STREAM_CHUNKS);
+
+  const chunks = [];
+  let current = [];
+  let chunkStart = 0;
+  for (const page of pages.slice(2)) {
+    current.push(page.data);
+    if (page.granule - chunkStart >= chunkSeconds * OPUS_SAMPLE_RATE) {
+      chunks.push(Buffer.concat([...headers, ...current]));
+      current = [];
+      chunkStart = page.granule;
+    }
+  }
+  if (current.length > 0) {
+    chunks.push(Buffer.concat([...headers, ...current]));
+  }
+  return chunks;
+}
+
+/**
+ * Поток распознавания через SpeechKit.
+ * Промежуточный текст - из фрагментов записи (распознаются параллельно),
+ * итоговый - из распознавания всей записи целиком, как и в обычном режиме.
+ * @param {Buffer} audioBuffer - Аудио в формате OGG
+ */
+async function* speechKitStream(audioBuffer) {
+  let fullDone = false;
+  const full = callSpeechToText(audioBuffer).finally(() => {
+    fullDone = true;
+  });
+  full.catch(() => {});
+
+  const chunks = chunkOggOpus(audioBuffer);
+  if (chunks.length > 1) {
+    const pending = chunks.map((chunk) => callSpeechToText(chunk).catch(() => ""));
+    const parts = [];
+    for (const part of pending) {
+      parts.push(await part);
+      if (fullDone) break;
+      const text = parts.filter((p) => p).join(" ");
+      if (text) yield { text, final: false };
+    }
+  }
+
+  yield { text: await full, final: true };
+}
+
+/**
+ * Имитация потока распознавания для локальных проверок
+ * @param {string} transcript - Итоговый текст
+ * @param {{wordsPerPartial?: number, delayMs?: number}} options - Темп выдачи
+ */
+async function* fakeSttStream(transcript, { wordsPerPartial = 2, delayMs = 300 } = {}) {
+  const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+  const words = transcript.split(/\s+/).filter((word) => word);
+  for (let i = wordsPerPartial; i < words.length; i += wordsPerPartial) {
+    await sleep(delayMs);
+    yield { text: words.slice(0, i).join(" "), final: false };
+  }
+  await sleep(delayMs);
+  yield { text: words.join(" "), final: true };
+}
+
+let sttStreamFactory = (audioBuffer) =>
+  process.env.STT_FAKE_TRANSCRIPT
+    ? fakeSttStream(process.env.STT_FAKE_TRANSCRIPT)
+    : speechKitStream(audioBuffer);
+
+/**
+ * Подменить источник потока распознавания (для тестов)
+ * @param {function(Buffer): AsyncIterable<{text: string, final: boolean}>} factory
+ */
+function setSttStreamFactory(factory) {
+  sttStreamFactory = factory;
+}
+
+/**
+ * Потоковая обработка аудио: промежуточный текст отдается сразу, а
+ * извлечение телефона/банка запускается, как только в тексте появился номер.
+ * События: { type: "partial", text }, { type: "result", ...ответ },
+ * { type: "error", error, message }.
+ * @param {Buffer} audioBuffer - Аудио в формате OGG
+ * @param {function(Object): void} emit - Получатель событий
+ */
+async function processAudioStream(audioBuffer, emit) {
+  let rawText = "";
+  let speculative = null;
+
+  try {
+    for await (const event of sttStreamFactory(audioBuffer)) {
+      rawText = event.text || "";
+      if (!event.final) {
+        emit({ type: "partial", text: rawText });
+      }
+
+      // Текста уже достаточно - начинаем извлечение, не дожидаясь конца
+      const phone = extractTenDigitPhone(rawText);
+      if (!speculative && phone) {
+        console.log("Запускаем извлечение по промежуточному тексту");
+        speculative = {
+          phone,
+          text: rawText,
+          result: extractDataWithGPT(rawText).catch((error) => ({ error })),
+        };
+      }
+    }
+  } catch (err) {
+    console.error("SpeechKit API error:", err);
+    emit({
+      type: "error",
+      error: "SpeechKit API Error",
+      message: `Failed to recognize speech: ${err.message}`,
+    });
+    return;
+  }
+
+  if (!rawText.trim()) {
+    emit({ type: "error", error: "Speech could not be recognized" });
+    return;
+  }
+
+  // Результат по промежуточному тексту годится, если номер не изменился
+  // и банк уже был найден (или текст с тех пор не изменился)
+  let outcome = null;
+  if (speculative && speculative.phone === extractTenDigitPhone(rawText)) {
+    const early = await speculative.result;
+    const bankFound = early.data && early.data.bank_name && early.data.bank_name !== "не указано";
+    if (bankFound || speculative.text === rawText) {
+      outcome = early;
+    }
+  }
+  if (!outcome) {
+    outcome = await extractDataWithGPT(rawText).catch((error) => ({ error }));
+  }
+
+  const extracted = outcome.error ? { bank_name: "не указано", phone_number: null } : outcome.data;
+  const gptError = outcome.error ? outcome.error.message : null;
+  emit({ type: "result", ...buildAudioResponse(rawText, extracted, gptError, outcome.routing || null) });
+}
+
 // ============================================================================
 // ОСНОВНАЯ ФУНКЦИЯ
 // ============================================================================
 
+/**
+ * Обычная обработка записи: распознавание целиком, извлечение данных и ответ
+ * @param {Buffer} audioBuffer - Аудио в формате OGG
+ * @returns {Promise<{statusCode: number, body: Object}>} Код и тело ответа
+ */
+async function recognizeAudio(audioBuffer) {
+  // 1. Распознавание речи через SpeechKit
+  console.log("Распознаем речь через SpeechKit...");
+  let rawText;
+  try {
+    rawText = await callSpeechToText(audioBuffer);
+  } catch (err) {
+    console.error("SpeechKit API error:", err);
+    return {
+      statusCode: 500,
+      body: {
+        error: "SpeechKit API Error",
+        message: `Failed to recognize speech: ${err.message}`,
+      },
+    };
+  }
+
+  if (!rawText || !rawText.trim()) {
+    return { statusCode: 422, body: { error: "Speech could not be recognized" } };
+  }
+
+  console.log("Распознанный текст:", rawText);
+
+  // 2. Извлечение данных через GPT (как в старом коде)
+  console.log("Извлекаем данные через GPT...");
+  let extracted = null;
+  let gptError = null;
+  let gptRouting = null;
+
+  try {
+    ({ data: extracted, routing: gptRouting } = await extractDataWithGPT(rawText));
+    console.log("GPT извлек данные:", extracted);
+  } catch (error) {
+    console.error("Ошибка GPT:", error.message);
+    gptError = error.message;
+    extracted = { bank_name: "не указано", phone_number: null };
+  }
+
+  // 3. Проверка номера (fallback) и подготовка ответа
+  const response = buildAudioResponse(rawText, extracted, gptError, gptRouting);
+
+  console.log("Финальный ответ:", JSON.stringify(response, null, 2));
+
+  return { statusCode: 200, body: response };
+}
+
 /**
  * Обработчик функции распознавания аудио
  * @param {Object} event - Событие от Yandex Cloud Functions
@@ -261,83 +616,27 @@ exports.handler = async function (event, context) {
       };
     }
 
-    // 1. Распознавание речи через SpeechKit
-    console.log("Распознаем речь через SpeechKit...");
-    let rawText;
-    try {
-      rawText = await callSpeechToText(audioBuffer);
-    } catch (err) {
-      console.error("SpeechKit API error:", err);
-      return {
-        statusCode: 500,
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-          error: "SpeechKit API Error",
-          message: `Failed to recognize speech: ${err.message}`,
-        }),
-      };
-    }
+    const result = await recognizeAudio(audioBuffer);
 
-    if (!rawText || !rawText.trim()) {
+    // Потоковый запрос: Cloud Functions отдают ответ целиком, и промежуточный
+    // текст не пришел бы раньше итога. Поэтому запись распознается один раз,
+    // без фрагментов и раннего GPT, а ответ - одно событие NDJSON.
+    // Живой поток событий отдает server.js
+    if (body.stream === true) {
+      const streamEvent = result.statusCode === 200
+        ? { type: "result", ...result.body }
+        : { type: "error", ...result.body };
       return {
-        statusCode: 422,
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ error: "Speech could not be recognized" }),
+        statusCode: 200,
+        headers: { "Content-Type": "application/x-ndjson" },
+        body: JSON.stringify(streamEvent) + "\n",
       };
     }
 
-    console.log("Распознанный текст:", rawText);
-
-    // 2. Извлечение данных через GPT (как в старом коде)
-    console.log("Извлекаем данные через GPT...");
-    let extracted = null;
-    let gptError = null;
-
-    try {
-      extracted = await extractDataWithGPT(rawText);
-      console.log("GPT извлек данные:", extracted);
-    } catch (error) {
-      console.error("Ошибка GPT:", error.message);
-      gptError = error.message;
-      extracted = { bank_name: "не указано", phone_number: null };
-    }
-
-    // 3. Дополнительная проверка номера (fallback) - как в старом коде
-    let finalPhoneNumber = extracted.phone_number;
-
-    if (!finalPhoneNumber || finalPhoneNumber === "null") {
-      console.log("GPT не извлек номер, пробуем fallback...");
-      finalPhoneNumber = extractTenDigitPhone(rawText);
-    } else {
-      // Проверяем, что номер содержит 10 цифр
-      const digitsOnly = finalPhoneNumber.replace(/\D/g, "");
-      if (digitsOnly.length === 10) {
-        finalPhoneNumber = digitsOnly;
-      } else {
-        console.log("GPT вернул некорректный номер, пробуем fallback...");
-        finalPhoneNumber = extractTenDigitPhone(rawText);
-      }
-    }
-
-    // 4. Подготовка ответа (точная копия старого кода)
-    const response = {
-      success: true,
-      bank_name: extracted.bank_name || "не указано",
-      phone_number: finalPhoneNumber,
-      raw_text: rawText,
-      processing_info: {
-        gpt_used: extracted.phone_number !== null,
-        gpt_error: gptError,
-        fallback_used: finalPhoneNumber !== null && extracted.phone_number === null,
-      },
-    };
-
-    console.log("Финальный ответ:", JSON.stringify(response, null, 2));
-
     return {
-      statusCode: 200,
+      statusCode: result.statusCode,
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify(response),
+      body: JSON.stringify(result.body),
     };
   } catch (error) {
     console.error("Общая ошибка:", error);
@@ -351,3 +650,9 @@ exports.handler = async function (event, context) {
     };
   }
 };
+
+exports.processAudioStream = processAudioStream;
+exports.validateAudio = validateAudio;
+exports.setSttStreamFactory = setSttStreamFactory;
+exports.fakeSttStream = fakeSttStream;
+exports.chunkOggOpus = chunkOggOpus;
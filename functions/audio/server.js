@@ -0,0 +1,103 @@
+const http = require("http");
+const { handler, processAudioStream, validateAudio } = require("./index");
+
+// ============================================================================
+// HTTP-СЕРВЕР ДЛЯ ЛОКАЛЬНОГО ЗАПУСКА И КОНТЕЙНЕРА
+// ============================================================================
+//
+// Cloud Functions отдают ответ целиком, поэтому handler на потоковый запрос
+// отвечает одним итоговым событием. Промежуточный текст есть только здесь:
+// сервер пишет события NDJSON по мере появления - для Serverless Containers
+// и локальных проверок:
+//
+//   STT_FAKE_TRANSCRIPT="номер 8 901 547 78 37 сбербанк" node server.js
+
+const PORT = Number(process.env.PORT) || 8080;
+
+/**
+ * Чтение тела запроса целиком
+ * @param {http.IncomingMessage} req - Входящий запрос
+ * @returns {Promise<string>} Тело запроса
+ */
+function readBody(req) {
+  return new Promise((resolve, reject) => {
+    const chunks = [];
+    req.on("data", (chunk) => chunks.push(chunk));
+    req.on("end", () => resolve(Buffer.concat(chunks).toString()));
+    req.on("error", reject);
+  });
+}
+
+/**
+ * Отправка ответа JSON целиком
+ * @param {http.ServerResponse} res - Ответ
+ * @param {number} statusCode - HTTP статус
+ * @param {Object} body - Тело ответа
+ */
+function sendJson(res, statusCode, body) {
+  res.writeHead(statusCode, { "Content-Type": "application/json" });
+  res.end(JSON.stringify(body));
+}
+
+/**
+ * Потоковый ответ: события NDJSON по мере распознавания.
+ * Проверки те же, что в handler: метод POST и размер аудио
+ * @param {http.ServerResponse} res - Ответ
+ * @param {string} audioBase64 - Аудио в base64
+ */
+async function streamAudio(res, audioBase64) {
+  const audioBuffer = Buffer.from(audioBase64, "base64");
+  try {
+    validateAudio(audioBuffer);
+  } catch (err) {
+    sendJson(res, 400, { error: "Bad Request", message: err.message });
+    return;
+  }
+
+  res.writeHead(200, { "Content-Type": "application/x-ndjson" });
+  await processAudioStream(audioBuffer, (event) => {
+    res.write(JSON.stringify(event) + "\n");
+  });
+  res.end();
+}
+
+async function handleRequest(req, res) {
+  const rawBody = await readBody(req);
+
+  let body = null;
+  try {
+    body = JSON.parse(rawBody);
+  } catch (err) {
+    // Некорректный JSON обработает handler
+  }
+
+  const audioBase64 = body && (body.audio || body.audioBase64);
+  if (req.method === "POST" && body && body.stream === true && audioBase64) {
+    await streamAudio(res, audioBase64);
+    return;
+  }
+
+  const result = await handler({ httpMethod: req.method, body: rawBody }, {});
+  res.writeHead(result.statusCode, result.headers);
+  res.end(result.body);
+}
+
+const server = http.createServer(async (req, res) => {
+  try {
+    await handleRequest(req, res);
+  } catch (error) {
+    // Ошибка не должна ронять процесс: отвечаем 500 или, если поток
+    // уже начат, событием ошибки
+    console.error("Общая ошибка:", error);
+    const errorBody = { error: "Internal Server Error", message: error.message };
+    if (!res.headersSent) {
+      sendJson(res, 500, errorBody);
+    } else if (!res.writableEnded) {
+      res.end(JSON.stringify({ type: "error", ...errorBody }) + "\n");
+    }
+  }
+});
+
+server.listen(PORT, () => {
+  console.log(`Audio function listening on port ${PORT}`);
+});
@@ -1,4 +1,5 @@
 const axios = require("axios");
+const { assessDocumentText, createGptRouter, modelRoutes } = require("./gpt-routing");
 
 // ============================================================================
 // КОНСТАНТЫ И КОНФИГУРАЦИЯ
@@ -11,6 +12,10 @@ const GPT_ENDPOINT = "https://llm.api.cloud.yandex.net/foundationModels/v1/compl
 const MIN_IMAGE_SIZE = 10240; // 10KB
 const MAX_IMAGE_SIZE = 4194304; // 4MB
 
+// Маршруты GPT (gpt-routing.js): лимиты токенов быстрой и большой модели
+const GPT_ROUTES = modelRoutes(150, 400);
+const MAX_FAST_ROUTE_CHARS = 3000; // длинный текст не помещается в короткий бюджет
+
 // ============================================================================
 // ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
 // ============================================================================
@@ -105,13 +110,20 @@ async function callYandexVision(imageBuffer) {
 }
 
 /**
- * Вызов Yandex GPT API для извлечения данных из водительских прав
+ * Промпт для извлечения данных из водительских прав
+ * @param {string} recognizedText - Распознанный текст
+ * @param {boolean} compact - Короткий промпт для быстрой модели
  */
-async function extractLicenseDataWithGPT(recognizedText) {
-  const apiKey = process.env.YANDEX_GPT_API_KEY;
-  const folderId = process.env.YANDEX_FOLDER_ID;
+function buildLicensePrompt(recognizedText, compact) {
+  if (compact) {
+    return `Извлеки из текста водительских прав ФИО на кириллице и номер (10 цифр без пробелов). Верни ТОЛЬКО JSON:
+{"full_name": "ФАМИЛИЯ ИМЯ ОТЧЕСТВО", "license_number": "10 цифр"}
 
-  const prompt = `Ты - система обработки текстовых данных. Извлеки информацию из предоставленного текста.
+Текст:
+${recognizedText}`;
+  }
+
+  return `Ты - система обработки текстовых данных. Извлеки информацию из предоставленного текста.
 
 ИЗВЛЕКИ СЛЕДУЮЩИЕ ДАННЫЕ:
 
@@ -141,13 +153,24 @@ ${recognizedText}
   "full_name": "ФИО или 'не указано'",
   "license_number": "10 цифр или 'не указан'"
 }`;
+}
+
+/**
+ * Вызов Yandex GPT API для извлечения данных из водительских прав
+ * @param {string} prompt - Промпт
+ * @param {string} routeName - Маршрут из GPT_ROUTES (модель и лимит токенов)
+ */
+async function callYandexGPT(prompt, routeName) {
+  const apiKey = process.env.YANDEX_GPT_API_KEY;
+  const folderId = process.env.YANDEX_FOLDER_ID;
+  const route = GPT_ROUTES[routeName];
 
   const payload = {
-    modelUri: `gpt://${folderId}/yandexgpt-lite`,
+    modelUri: `gpt://${folderId}/${route.model}`,
     completionOptions: {
       stream: false,
       temperature: 0.1,
-      maxTokens: 400,
+      maxTokens: route.maxTokens,
     },
     messages: [
       {
@@ -180,6 +203,14 @@ ${recognizedText}
   }
 }
 
+/**
+ * Проверка ответа GPT: ФИО и номер из 10 цифр
+ */
+function isValidLicenseData(data) {
+  if (!data || data.error) return false;
+  return formatFullName(data.full_name) !== "не указано" && cleanLicenseNumber(data.license_number) !== "не указан";
+}
+
 /**
  * Очистка номера прав (удаление всех нецифровых символов)
  */
@@ -211,6 +242,56 @@ function formatFullName(fullName) {
   return fullName.toUpperCase().replace(/\s+/g, " ").trim();
 }
 
+/**
+ * Оценка, насколько текст похож на лицевую сторону прав
+ * (на лицевой стороне - заголовок и пронумерованные поля 1-9,
+ * на обратной - таблица категорий и особые отметки)
+ */
+function scoreFrontSide(text) {
+  if (!text) return 0;
+  const upper = text.toUpperCase();
+  let score = 0;
+  if (/ВОДИТЕЛЬСКОЕ\s+УДОСТОВЕРЕНИЕ|DRIVING\s+LICEN[CS]E/.test(upper)) score += 2;
+  if (/(^|\s)4[аa]\)/i.test(text)) score += 1;
+  if (/(^|\s)4[сc]\)/i.test(text)) score += 1;
+  if (/ОСОБЫЕ\s+ОТМЕТКИ/.test(upper)) score -= 2;
+  if (/\b(BE|CE|DE|C1E|D1E)\b/.test(upper)) score -= 1;
+  return score;
+}
+
+/**
+ * Упорядочить стороны прав: при необходимости поменять местами
+ * @returns {{frontText: string, backText: string, swapped: boolean}}
+ */
+function orderLicenseSides(firstText, secondText) {
+  if (scoreFrontSide(secondText) > scoreFrontSide(firstText)) {
+    return { frontText: secondText, backText: firstText, swapped: true };
+  }
+  return { frontText: firstText, backText: secondText, swapped: false };
+}
+
+// ============================================================================
+// МАРШРУТИЗАЦИЯ МОДЕЛЕЙ GPT
+// ============================================================================
+//
+// Выбор модели и статистика - в gpt-routing.js; здесь признаки нормально
+// распознанного документа.
+
+// Метки полей, по которым видно, что текст распознан нормально
+const EXPECTED_LABELS = [
+  /ВОДИТЕЛЬСКОЕ|УДОСТОВЕРЕНИЕ|DRIVING/i,
+  /(^|\s)1\.\s?\S/,
+  /(^|\s)4[аa]\)/i,
+  /(^|\s)5\.\s?\S/,
+  /\d{2}\s?\d{2}\s?\d{6}/,
+];
+
+const gptRouter = createGptRouter({
+  callModel: callYandexGPT,
+  assessTextQuality: (text) => assessDocumentText(text, EXPECTED_LABELS, MAX_FAST_ROUTE_CHARS),
+  maxFastChars: MAX_FAST_ROUTE_CHARS,
+});
+
 // ============================================================================
 // ОСНОВНАЯ ФУНКЦИЯ
 // ============================================================================
@@ -253,17 +334,21 @@ exports.handler = async function (event, context) {
       recognizedText = body.text;
       console.log("Используется готовый текст, длина:", recognizedText.length);
     } else if (body.front_image && body.back_image) {
-      // Вариант 1: Два изображения - распознаем оба
+      // Вариант 1: Два изображения - распознаем оба параллельно
       console.log("Распознаем два изображения (лицевая и обратная стороны)...");
+      const [firstImage, secondImage] = [body.front_image, body.back_image];
 
       try {
-        // Распознаем лицевую сторону
-        const frontBuffer = Buffer.from(body.front_image, "base64");
-        const frontText = await callYandexVision(frontBuffer);
-
-        // Распознаем обратную сторону
-        const backBuffer = Buffer.from(body.back_image, "base64");
-        const backText = await callYandexVision(backBuffer);
+        const [firstText, secondText] = await Promise.all([
+          callYandexVision(Buffer.from(firstImage, "base64")),
+          callYandexVision(Buffer.from(secondImage, "base64")),
+        ]);
+
+        // Стороны определяем по содержимому, порядок фото - только подсказка
+        const { frontText, backText, swapped } = orderLicenseSides(firstText, secondText);
+        if (swapped) {
+          console.log("Стороны прав переданы в обратном порядке, меняем местами");
+        }
 
         // Объединяем тексты
         recognizedText = `ЛИЦЕВАЯ СТОРОНА:
@@ -365,8 +450,11 @@ ${backText || ""}`;
 
     // Извлечение данных через GPT
     let licenseData;
+    let gptRouting;
     try {
-      licenseData = await extractLicenseDataWithGPT(recognizedText);
+      const extraction = await gptRouter.extract(recognizedText, buildLicensePrompt, isValidLicenseData);
+      licenseData = extraction.data;
+      gptRouting = extraction.routing;
     } catch (err) {
       console.error("GPT API error:", err);
       return {
@@ -419,6 +507,9 @@ ${backText || ""}`;
         success: true,
         full_name: formattedData.full_name,
         license_number: formattedData.license_number,
+        processing_info: {
+          gpt_routing: gptRouting,
+        },
       }),
     };
   } catch (error) {
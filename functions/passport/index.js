@@ -1,4 +1,6 @@
 const axios = require("axios");
+const { assessDocumentText, createGptRouter, modelRoutes } = require("./gpt-routing");
+const { MIN_FAST_PATH_CONFIDENCE, parsePassportText } = require("./mrz");
 
 // ============================================================================
 // КОНСТАНТЫ И КОНФИГУРАЦИЯ
@@ -11,6 +13,10 @@ const GPT_ENDPOINT = "https://llm.api.cloud.yandex.net/foundationModels/v1/compl
 const MIN_IMAGE_SIZE = 10240; // 10KB
 const MAX_IMAGE_SIZE = 4194304; // 4MB
 
+// Маршруты GPT (gpt-routing.js): лимиты токенов быстрой и большой модели
+const GPT_ROUTES = modelRoutes(200, 1500);
+const MAX_FAST_ROUTE_CHARS = 2000; // длинный текст не помещается в короткий бюджет
+
 // ============================================================================
 // ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
 // ============================================================================
@@ -97,7 +103,8 @@ async function callYandexVision(imageBuffer) {
         features: [
           {
             type: "TEXT_DETECTION",
-            textDetectionConfig: { languageCodes: ["ru"] },
+            // "en" нужен для латиницы машиночитаемой зоны
+            textDetectionConfig: { languageCodes: ["ru", "en"] },
           },
         ],
       },
@@ -115,16 +122,21 @@ async function callYandexVision(imageBuffer) {
 }
 
 /**
- * Вызывает Yandex GPT API для структурирования данных паспорта
+ * Промпт для извлечения данных паспорта
  * @param {string} recognizedText - Распознанный текст из Vision
- * @returns {Promise<Object>} Структурированные данные паспорта
- * @throws {Error} При ошибке API или некорректном ответе
+ * @param {boolean} compact - Короткий промпт для быстрой модели
+ * @returns {string} Текст промпта
  */
-async function callYandexGPT(recognizedText) {
-  const apiKey = process.env.YANDEX_GPT_API_KEY;
-  const folderId = process.env.YANDEX_FOLDER_ID;
+function buildPassportPrompt(recognizedText, compact) {
+  if (compact) {
+    return `Извлеки данные паспорта РФ из текста. Верни ТОЛЬКО JSON:
+{"last_name": "", "first_name": "", "middle_name": "", "birth_date": "ДД.ММ.ГГГГ", "birth_place": "", "passport_number": "10 цифр без пробелов", "citizenship": ""}
 
-  const prompt = `ПРОАНАЛИЗИРУЙ ТЕКСТ ПАСПОРТА И ИЗВЛЕКИ ВСЕ ДАННЫЕ:
+Текст:
+${recognizedText}`;
+  }
+
+  return `ПРОАНАЛИЗИРУЙ ТЕКСТ ПАСПОРТА И ИЗВЛЕКИ ВСЕ ДАННЫЕ:
 
 ОБЯЗАТЕЛЬНЫЕ ПОЛЯ:
 1. Фамилия (как в тексте)
@@ -148,13 +160,26 @@ async function callYandexGPT(recognizedText) {
 
 Текст для анализа:
 ${recognizedText}`;
+}
+
+/**
+ * Вызывает Yandex GPT API для структурирования данных паспорта
+ * @param {string} prompt - Промпт
+ * @param {string} routeName - Маршрут из GPT_ROUTES (модель и лимит токенов)
+ * @returns {Promise<Object>} Структурированные данные паспорта
+ * @throws {Error} При ошибке API
+ */
+async function callYandexGPT(prompt, routeName) {
+  const apiKey = process.env.YANDEX_GPT_API_KEY;
+  const folderId = process.env.YANDEX_FOLDER_ID;
+  const route = GPT_ROUTES[routeName];
 
   const payload = {
-    modelUri: `gpt://${folderId}/yandexgpt-lite`,
+    modelUri: `gpt://${folderId}/${route.model}`,
     completionOptions: {
       stream: false,
       temperature: 0.1,
-      maxTokens: 1500,
+      maxTokens: route.maxTokens,
     },
     messages: [
       {
@@ -187,6 +212,44 @@ ${recognizedText}`;
   }
 }
 
+/**
+ * Проверка ответа GPT: ФИО, номер из 10 цифр и дата рождения
+ * @param {Object} data - Ответ GPT
+ * @returns {boolean} true если ответ можно отдавать без эскалации
+ */
+function isValidPassportData(data) {
+  if (!data || data.error) return false;
+  const number = String(data.passport_number || "").replace(/\s/g, "");
+  return (
+    Boolean(data.last_name && data.first_name) &&
+    /^\d{10}$/.test(number) &&
+    /^\d{2}\.\d{2}\.\d{4}$/.test(data.birth_date || "")
+  );
+}
+
+// ============================================================================
+// МАРШРУТИЗАЦИЯ МОДЕЛЕЙ GPT
+// ============================================================================
+//
+// Выбор модели и статистика - в gpt-routing.js; здесь признаки нормально
+// распознанного документа.
+
+// Метки полей, по которым видно, что текст распознан нормально
+const EXPECTED_LABELS = [
+  /ФАМИЛИЯ/i,
+  /(^|\s)ИМЯ/i,
+  /ОТЧЕСТВО/i,
+  /РОЖДЕНИЯ/i,
+  /ПАСПОРТ|ВЫДАН/i,
+  /\d{2}\s?\d{2}\s?\d{6}/,
+];
+
+const gptRouter = createGptRouter({
+  callModel: callYandexGPT,
+  assessTextQuality: (text) => assessDocumentText(text, EXPECTED_LABELS, MAX_FAST_ROUTE_CHARS),
+  maxFastChars: MAX_FAST_ROUTE_CHARS,
+});
+
 // ============================================================================
 // ОСНОВНАЯ ФУНКЦИЯ
 // ============================================================================
@@ -292,33 +355,45 @@ exports.handler = async function (event, context) {
       };
     }
 
-    // Структурирование данных через GPT
+    // Быстрый путь: разбор MRZ и печатных полей без GPT
+    const parsed = parsePassportText(recognizedText);
     let passportData;
-    try {
-      passportData = await callYandexGPT(recognizedText);
-    } catch (err) {
-      console.error("GPT API error:", err);
-      return {
-        statusCode: 500,
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-          error: "GPT API Error",
-          message: `Failed to structure data: ${err.message}`,
-        }),
-      };
-    }
+    let parser = "mrz";
+    let gptRouting = null;
+
+    if (parsed.data && parsed.confidence >= MIN_FAST_PATH_CONFIDENCE) {
+      passportData = parsed.data;
+    } else {
+      // Структурирование данных через GPT, если разбор не удался или есть конфликты
+      parser = "gpt";
+      try {
+        const extraction = await gptRouter.extract(recognizedText, buildPassportPrompt, isValidPassportData);
+        passportData = extraction.data;
+        gptRouting = extraction.routing;
+      } catch (err) {
+        console.error("GPT API error:", err);
+        return {
+          statusCode: 500,
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({
+            error: "GPT API Error",
+            message: `Failed to structure data: ${err.message}`,
+          }),
+        };
+      }
 
-    // Проверка на ошибки в ответе GPT
-    if (passportData.error) {
-      return {
-        statusCode: 500,
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-          error: "GPT Processing Error",
-          message: passportData.error,
-          raw_text: passportData.raw_text,
-        }),
-      };
+      // Проверка на ошибки в ответе GPT
+      if (passportData.error) {
+        return {
+          statusCode: 500,
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({
+            error: "GPT Processing Error",
+            message: passportData.error,
+            raw_text: passportData.raw_text,
+          }),
+        };
+      }
     }
 
     // Возврат успешного ответа
@@ -334,6 +409,13 @@ exports.handler = async function (event, context) {
         birth_place: passportData.birth_place,
         passport_number: passportData.passport_number,
         citizenship: passportData.citizenship,
+        processing_info: {
+          parser,
+          gpt_used: parser === "gpt",
+          mrz_confidence: parsed.confidence,
+          mrz_conflicts: parsed.conflicts,
+          gpt_routing: gptRouting,
+        },
       }),
     };
   } catch (error) {
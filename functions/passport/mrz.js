@@ -0,0 +1,287 @@
+// ============================================================================
+// РАЗБОР MRZ И ПОЛЕЙ ПАСПОРТА РФ БЕЗ GPT
+// ============================================================================
+//
+// Внутренний паспорт РФ (с 2011 г.) содержит машиночитаемую зону из двух
+// строк по 44 символа:
+//
+//   PNRUSZDRIL7K<<SERGEQ<ANATOL9EVI3<<<<<<<<<<<<<
+//   3919353498RUS7207233M<<<<<<<4151218910003<50
+//
+// Строка 1: тип документа, страна и ФИО в транслитерации по таблице МВД.
+// Строка 2: серия (3 цифры) + номер (6 цифр), контрольная цифра, гражданство,
+// дата рождения (ГГММДД) с контрольной цифрой, пол, затем в доп. данных —
+// последняя цифра серии, дата выдачи и код подразделения, контрольная цифра
+// доп. данных и общая контрольная цифра.
+
+const MRZ_LINE_LENGTH = 44;
+
+// Минимальная уверенность, при которой результат отдается без GPT
+const MIN_FAST_PATH_CONFIDENCE = 0.8;
+
+// Таблица транслитерации MRZ внутреннего паспорта РФ (обратимая)
+const MRZ_TO_CYRILLIC = {
+  A: "А", B: "Б", V: "В", G: "Г", D: "Д", E: "Е", 2: "Ё", J: "Ж",
+  Z: "З", I: "И", Q: "Й", K: "К", L: "Л", M: "М", N: "Н", O: "О",
+  P: "П", R: "Р", S: "С", T: "Т", U: "У", F: "Ф", H: "Х", C: "Ц",
+  3: "Ч", 4: "Ш", W: "Щ", X: "Ъ", Y: "Ы", 9: "Ь", 6: "Э", 7: "Ю",
+  8: "Я",
+};
+
+// Цифры, которых нет в таблице транслитерации: в полях ФИО так OCR
+// читает буквы O и I
+const NAME_OCR_CONFUSIONS = { 0: "O", 1: "I" };
+
+// Кириллические символы, которые OCR путает с латиницей в MRZ
+const CYRILLIC_LOOKALIKES = {
+  А: "A", В: "B", Е: "E", К: "K", М: "M", Н: "H", О: "O", Р: "P",
+  С: "C", Т: "T", Х: "X", У: "Y", З: "3", Ч: "4", "«": "<<", "‹": "<",
+};
+
+/**
+ * Контрольная цифра MRZ (ICAO 9303, веса 7-3-1)
+ * @param {string} value - Строка из символов MRZ
+ * @returns {number} Контрольная цифра
+ */
+function computeCheckDigit(value) {
+  const weights = [7, 3, 1];
+  let sum = 0;
+  for (let i = 0; i < value.length; i++) {
+    const ch = value[i];
+    let code = 0;
+    if (ch >= "0" && ch <= "9") code = ch.charCodeAt(0) - 48;
+    else if (ch >= "A" && ch <= "Z") code = ch.charCodeAt(0) - 55;
+    sum += code * weights[i % 3];
+  }
+  return sum % 10;
+}
+
+/**
+ * Проверка контрольной цифры ("<" считается нулем)
+ * @param {string} value - Проверяемое поле
+ * @param {string} digit - Символ контрольной цифры
+ * @returns {boolean} true если цифра совпадает
+ */
+function isCheckDigitValid(value, digit) {
+  const expected = digit === "<" ? 0 : Number(digit);
+  return !Number.isNaN(expected) && computeCheckDigit(value) === expected;
+}
+
+/**
+ * Исправление типичных ошибок OCR в поле имени MRZ (0 вместо O, 1 вместо I)
+ * @param {string} value - Часть имени из MRZ
+ * @returns {string} Часть имени
+ */
+function fixNameOcrConfusions(value) {
+  return value.replace(/[01]/g, (ch) => NAME_OCR_CONFUSIONS[ch]);
+}
+
+/**
+ * Все ли символы имени есть в таблице транслитерации
+ * @param {string} value - Часть имени из MRZ
+ * @returns {boolean} true если имя можно транслитерировать без потерь
+ */
+function isTransliterable(value) {
+  return value.split("").every((ch) => MRZ_TO_CYRILLIC[ch] !== undefined);
+}
+
+/**
+ * Обратная транслитерация имени из MRZ в кириллицу
+ * @param {string} value - Часть имени из MRZ
+ * @returns {string} Имя кириллицей
+ */
+function transliterateFromMrz(value) {
+  return value
+    .split("")
+    .map((ch) => MRZ_TO_CYRILLIC[ch] || "")
+    .join("");
+}
+
+/**
+ * Приведение строки OCR к алфавиту MRZ
+ * @param {string} line - Строка распознанного текста
+ * @returns {string} Строка из символов A-Z, 0-9 и "<"
+ */
+function normalizeMrzLine(line) {
+  return line
+    .toUpperCase()
+    .split("")
+    .map((ch) => (CYRILLIC_LOOKALIKES[ch] !== undefined ? CYRILLIC_LOOKALIKES[ch] : ch))
+    .join("")
+    .replace(/[^A-Z0-9<]/g, "");
+}
+
+/**
+ * Поиск двух строк MRZ в тексте Vision
+ * @param {string} text - Распознанный текст
+ * @returns {{line1: string, line2: string}|null} Строки MRZ или null
+ */
+function findMrzLines(text) {
+  const lines = text
+    .split("\n")
+    .map(normalizeMrzLine)
+    .filter((line) => line.length >= 30);
+
+  const line1Index = lines.findIndex((line) => /^P.RUS/.test(line));
+  const line2 = lines.find((line) => /^\d{9}\dRUS\d{7}[MF]/.test(line));
+  if (!line2) return null;
+
+  const line1 = line1Index !== -1 ? lines[line1Index] : null;
+  return {
+    line1: line1 ? line1.padEnd(MRZ_LINE_LENGTH, "<").slice(0, MRZ_LINE_LENGTH) : null,
+    line2: line2.padEnd(MRZ_LINE_LENGTH, "<").slice(0, MRZ_LINE_LENGTH),
+  };
+}
+
+/**
+ * Дата ГГММДД из MRZ в формат ДД.ММ.ГГГГ
+ * @param {string} value - Дата из MRZ
+ * @returns {string|null} Дата или null
+ */
+function formatMrzDate(value) {
+  if (!/^\d{6}$/.test(value)) return null;
+  const yy = Number(value.slice(0, 2));
+  const currentYy = new Date().getFullYear() % 100;
+  const year = yy > currentYy ? 1900 + yy : 2000 + yy;
+  return `${value.slice(4, 6)}.${value.slice(2, 4)}.${year}`;
+}
+
+/**
+ * Разбор MRZ паспорта РФ
+ * @param {{line1: string|null, line2: string}} mrz - Строки MRZ
+ * @returns {Object} Поля паспорта и результаты проверок контрольных цифр
+ */
+function parseMrz(mrz) {
+  const { line1, line2 } = mrz;
+  const result = { checks: {}, unreadable: [] };
+
+  if (line1) {
+    const names = fixNameOcrConfusions(line1.slice(5)).split("<<").filter((part) => part);
+    const [surname = "", given = ""] = names;
+    const [firstName = "", ...middle] = given.split("<").filter((part) => part);
+    // У полей ФИО нет контрольных цифр: символ вне таблицы - ошибка OCR,
+    // которую нельзя исправить без потери буквы
+    const fields = { last_name: surname, first_name: firstName, middle_name: middle.join("") };
+    for (const [field, value] of Object.entries(fields)) {
+      result[field] = transliterateFromMrz(value);
+      if (!isTransliterable(value)) result.unreadable.push(field);
+    }
+  }
+
+  const optional = line2.slice(28, 42);
+  result.passport_number = `${line2.slice(0, 3)}${optional[0]}${line2.slice(3, 9)}`;
+  result.birth_date = formatMrzDate(line2.slice(13, 19));
+  result.citizenship = "Россия";
+
+  result.checks.number = isCheckDigitValid(line2.slice(0, 9), line2[9]);
+  result.checks.birth_date = isCheckDigitValid(line2.slice(13, 19), line2[19]);
+  result.checks.optional = isCheckDigitValid(optional, line2[42]);
+  result.checks.composite = isCheckDigitValid(
+    line2.slice(0, 10) + line2.slice(13, 20) + line2.slice(21, 43),
+    line2[43]
+  );
+  return result;
+}
+
+/**
+ * Разбор печатных полей страницы паспорта регулярными выражениями
+ * @param {string} text - Распознанный текст
+ * @returns {Object} Найденные поля (могут отсутствовать)
+ */
+function parseLayout(text) {
+  const result = {};
+  const lines = text.split("\n").map((line) => line.trim()).filter((line) => line);
+
+  const numberMatch = text.match(/(?:^|\D)(\d{2})\s?(\d{2})\s?(\d{6})(?!\d)/);
+  if (numberMatch) {
+    result.passport_number = numberMatch.slice(1, 4).join("");
+  }
+
+  const labelValue = (label) => {
+    const index = lines.findIndex((line) => label.test(line));
+    if (index === -1) return null;
+    const inline = lines[index].replace(label, "").trim();
+    const candidate = inline || lines[index + 1] || "";
+    return /^[А-ЯЁ-]{2,}$/.test(candidate.toUpperCase()) ? candidate.toUpperCase() : null;
+  };
+  result.last_name = labelValue(/^Фамилия/i);
+  result.first_name = labelValue(/^Имя/i);
+  result.middle_name = labelValue(/^Отчество/i);
+
+  const placeIndex = lines.findIndex((line) => /^Место рождения/i.test(line));
+  if (placeIndex !== -1) {
+    const inline = lines[placeIndex].replace(/^Место рождения/i, "").trim();
+    result.birth_place = (inline || lines[placeIndex + 1] || "").toUpperCase() || null;
+  }
+  return result;
+}
+
+/**
+ * Локальный разбор паспорта: MRZ + печатные поля, с оценкой уверенности
+ * @param {string} text - Распознанный текст из Vision
+ * @returns {{data: Object|null, confidence: number, conflicts: string[]}}
+ *   Данные паспорта (в формате ответа функции), уверенность 0..1 и
+ *   список полей, по которым MRZ расходится с печатным текстом или
+ *   содержит символы вне таблицы транслитерации
+ */
+function parsePassportText(text) {
+  const mrzLines = findMrzLines(text || "");
+  if (!mrzLines) {
+    return { data: null, confidence: 0, conflicts: [] };
+  }
+
+  const mrz = parseMrz(mrzLines);
+  const printedText = text
+    .split("\n")
+    .filter((line) => !line.includes("<") && !/RUS\d{7}/.test(normalizeMrzLine(line)))
+    .join("\n");
+  const layout = parseLayout(printedText);
+  const conflicts = [];
+
+  let confidence = 0;
+  if (mrz.checks.number) confidence += 0.35;
+  if (mrz.checks.birth_date) confidence += 0.15;
+  if (mrz.checks.optional) confidence += 0.1;
+  if (mrz.checks.composite) confidence += 0.2;
+  if (mrz.last_name && mrz.first_name) confidence += 0.2;
+
+  if (layout.passport_number) {
+    if (layout.passport_number !== mrz.passport_number) {
+      conflicts.push("passport_number");
+    }
+  }
+  conflicts.push(...mrz.unreadable);
+  for (const field of ["last_name", "first_name", "middle_name"]) {
+    if (mrz.unreadable.includes(field)) continue;
+    const printed = layout[field];
+    if (printed && mrz[field] && printed.replace(/Ё/g, "Е") !== mrz[field].replace(/Ё/g, "Е")) {
+      conflicts.push(field);
+    }
+  }
+  // Без ФИО (не прочитана первая строка MRZ) или при расхождениях
+  // быстрый путь закрыт, как бы ни сошлись контрольные цифры
+  if (conflicts.length > 0 || !mrz.last_name || !mrz.first_name) {
+    confidence = Math.min(confidence, MIN_FAST_PATH_CONFIDENCE - 0.1);
+  }
+
+  return {
+    data: {
+      last_name: mrz.last_name || "",
+      first_name: mrz.first_name || "",
+      middle_name: mrz.middle_name || "",
+      birth_date: mrz.birth_date,
+      birth_place: layout.birth_place || null,
+      passport_number: mrz.passport_number,
+      citizenship: mrz.citizenship,
+    },
+    confidence: Math.round(confidence * 100) / 100,
+    conflicts,
+  };
+}
+
+module.exports = {
+  MIN_FAST_PATH_CONFIDENCE,
+  computeCheckDigit,
+  transliterateFromMrz,
+  parsePassportText,
+};
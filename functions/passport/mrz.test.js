@@ -0,0 +1,61 @@
+const test = require("node:test");
+const assert = require("node:assert");
+const { MIN_FAST_PATH_CONFIDENCE, computeCheckDigit, parsePassportText } = require("./mrz");
+
+/**
+ * Строка 2 MRZ с правильными контрольными цифрами
+ */
+function buildLine2({ number = "391935349", birth = "720723", optional = "4151218910003" } = {}) {
+  const opt = optional.padEnd(14, "<");
+  let line = `${number}${computeCheckDigit(number)}RUS${birth}${computeCheckDigit(birth)}M<<<<<<<${opt}${computeCheckDigit(opt)}`;
+  const composite = line.slice(0, 10) + line.slice(13, 20) + line.slice(21, 43);
+  line += computeCheckDigit(composite);
+  return line;
+}
+
+const LINE1 = "PNRUSZDRIL7K<<SERGEQ<ANATOL9EVI3".padEnd(44, "<");
+
+test("valid MRZ is parsed and passes the fast path", () => {
+  const parsed = parsePassportText(`${LINE1}\n${buildLine2()}`);
+  assert.strictEqual(parsed.data.last_name, "ЗДРИЛЮК");
+  assert.strictEqual(parsed.data.first_name, "СЕРГЕЙ");
+  assert.strictEqual(parsed.data.middle_name, "АНАТОЛЬЕВИЧ");
+  assert.strictEqual(parsed.data.birth_date, "23.07.1972");
+  assert.strictEqual(parsed.data.passport_number, "3914935349");
+  assert.deepStrictEqual(parsed.conflicts, []);
+  assert.ok(parsed.confidence >= MIN_FAST_PATH_CONFIDENCE);
+});
+
+test("bad check digit keeps the GPT path", () => {
+  const line2 = buildLine2();
+  const broken = line2.slice(0, 9) + String((Number(line2[9]) + 1) % 10) + line2.slice(10);
+  const parsed = parsePassportText(`${LINE1}\n${broken}`);
+  assert.ok(parsed.confidence < MIN_FAST_PATH_CONFIDENCE);
+});
+
+test("missing line 1 keeps the GPT path", () => {
+  const parsed = parsePassportText(buildLine2());
+  assert.strictEqual(parsed.data.last_name, "");
+  assert.ok(parsed.confidence < MIN_FAST_PATH_CONFIDENCE);
+});
+
+test("OCR digits for O and I in names are corrected", () => {
+  const line1 = "PNRUSZDR1L7K<<SERGEQ<ANAT0L9EVI3".padEnd(44, "<");
+  const parsed = parsePassportText(`${line1}\n${buildLine2()}`);
+  assert.strictEqual(parsed.data.last_name, "ЗДРИЛЮК");
+  assert.strictEqual(parsed.data.middle_name, "АНАТОЛЬЕВИЧ");
+  assert.ok(parsed.confidence >= MIN_FAST_PATH_CONFIDENCE);
+});
+
+test("unreadable name character keeps the GPT path", () => {
+  const line1 = "PNRUSZDRIL7K<<SERGEQ<ANATOL9EVI5".padEnd(44, "<");
+  const parsed = parsePassportText(`${line1}\n${buildLine2()}`);
+  assert.deepStrictEqual(parsed.conflicts, ["middle_name"]);
+  assert.ok(parsed.confidence < MIN_FAST_PATH_CONFIDENCE);
+});
+
+test("text without MRZ returns no data", () => {
+  const parsed = parsePassportText("ПАСПОРТ\nФамилия ИВАНОВ");
+  assert.strictEqual(parsed.data, null);
+  assert.strictEqual(parsed.confidence, 0);
+});
@@ -0,0 +1,160 @@
+// ============================================================================
+// МАРШРУТИЗАЦИЯ МОДЕЛЕЙ GPT (общий модуль функций)
+// ============================================================================
+//
+// Функции развертываются по отдельности, поэтому копия модуля лежит в папке
+// каждой из них. Правьте только functions/shared/gpt-routing.js и
+// обновляйте копии командой `node functions/sync-shared.js`.
+//
+// Чистый текст уходит в быструю модель; зашумленный - сразу в большую.
+// Если ответ быстрой модели не прошел проверку или API вернул ошибку,
+// запрос повторяется на большой модели с полным промптом. Статистика
+// маршрутов копится, пока жив экземпляр функции, и пишется в лог.
+
+const MIN_FAST_ROUTE_QUALITY = 0.6; // оценка текста 0..1, ниже - сразу большая модель
+const ROUTE_LATENCY_SAMPLES = 200;
+
+/**
+ * Маршруты GPT: быстрая модель с коротким промптом и малым бюджетом токенов
+ * для чистого текста и большая модель с полным промптом для сложных случаев
+ * @param {number} fastMaxTokens - Лимит токенов быстрой модели
+ * @param {number} strongMaxTokens - Лимит токенов большой модели
+ * @returns {{fast: {model: string, maxTokens: number}, strong: {model: string, maxTokens: number}}}
+ */
+function modelRoutes(fastMaxTokens, strongMaxTokens) {
+  return {
+    fast: { model: process.env.GPT_FAST_MODEL || "yandexgpt-lite", maxTokens: fastMaxTokens },
+    strong: { model: process.env.GPT_STRONG_MODEL || "yandexgpt/latest", maxTokens: strongMaxTokens },
+  };
+}
+
+/**
+ * Оценка качества текста документа после OCR: доля мусорных символов,
+ * доля кириллицы среди букв и найденные метки полей
+ * @param {string} text - Текст из Vision
+ * @param {RegExp[]} expectedLabels - Метки полей, по которым видно, что текст распознан нормально
+ * @param {number} maxChars - Длина, выше которой текст не подходит быстрой модели
+ * @returns {{score: number, flags: string[]}} Оценка 0..1 и причины снижения
+ */
+function assessDocumentText(text, expectedLabels, maxChars) {
+  const chars = text.replace(/\s/g, "");
+  if (!chars) return { score: 0, flags: ["empty"] };
+
+  const junk = chars.replace(/[0-9A-Za-zА-Яа-яЁё.,:;()\/"«»№-]/g, "").length / chars.length;
+  const letters = chars.replace(/[^A-Za-zА-Яа-яЁё]/g, "");
+  const cyrillic = letters ? letters.replace(/[^А-Яа-яЁё]/g, "").length / letters.length : 0;
+  const labels = expectedLabels.filter((re) => re.test(text)).length / expectedLabels.length;
+
+  const flags = [];
+  if (junk > 0.1) flags.push("junk");
+  if (cyrillic < 0.5) flags.push("latin");
+  if (labels < 0.5) flags.push("labels");
+  if (text.length > maxChars) flags.push("long");
+
+  const score = 0.4 * Math.max(0, 1 - junk * 4) + 0.2 * cyrillic + 0.4 * labels;
+  return { score: Math.round(score * 100) / 100, flags };
+}
+
+/**
+ * Маршрутизатор запросов к GPT со статистикой по маршрутам
+ * @param {Object} options
+ * @param {function(string, string): Promise<Object>} options.callModel - Вызов GPT (промпт, маршрут)
+ * @param {function(string): {score: number, flags: string[]}} options.assessTextQuality - Оценка текста
+ * @param {number} options.maxFastChars - Длина, выше которой текст идет в большую модель
+ * @returns {{extract: function, stats: function}} Извлечение с выбором модели и сводка статистики
+ */
+function createGptRouter({ callModel, assessTextQuality, maxFastChars }) {
+  const routeStats = {};
+  let escalations = 0;
+
+  function recordRoute(routeName, latencyMs, ok) {
+    if (!routeStats[routeName]) {
+      routeStats[routeName] = { calls: 0, successes: 0, latencies: [] };
+    }
+    const stats = routeStats[routeName];
+    stats.calls += 1;
+    if (ok) stats.successes += 1;
+    stats.latencies.push(latencyMs);
+    if (stats.latencies.length > ROUTE_LATENCY_SAMPLES) stats.latencies.shift();
+  }
+
+  /**
+   * Сводка по маршрутам: число вызовов, доля успешных, задержка p50/p95
+   * @returns {Object} Статистика маршрутов
+   */
+  function stats() {
+    const routes = {};
+    for (const [routeName, route] of Object.entries(routeStats)) {
+      const sorted = [...route.latencies].sort((a, b) => a - b);
+      routes[routeName] = {
+        calls: route.calls,
+        success_rate: Math.round((route.successes / route.calls) * 100) / 100,
+        p50_ms: sorted[Math.floor(sorted.length / 2)],
+        p95_ms: sorted[Math.min(sorted.length - 1, Math.floor(sorted.length * 0.95))],
+      };
+    }
+    return { routes, escalations };
+  }
+
+  async function callRoute(routeName, prompt, isValid) {
+    const started = Date.now();
+    try {
+      const data = await callModel(prompt, routeName);
+      const ok = isValid(data);
+      recordRoute(routeName, Date.now() - started, ok);
+      return { data, ok };
+    } catch (err) {
+      recordRoute(routeName, Date.now() - started, false);
+      throw err;
+    }
+  }
+
+  /**
+   * Извлечение данных с выбором модели по качеству текста
+   * @param {string} text - Распознанный текст
+   * @param {function(string, boolean): string} buildPrompt - Промпт (compact для быстрой модели)
+   * @param {function(Object): boolean} isValid - Проверка ответа
+   * @returns {Promise<{data: Object, routing: Object}>} Данные и маршрут (route, text_quality, latency_ms)
+   * @throws {Error} При ошибке API большой модели
+   */
+  async function extract(text, buildPrompt, isValid) {
+    const started = Date.now();
+    const quality = assessTextQuality(text);
+    const useFast = quality.score >= MIN_FAST_ROUTE_QUALITY && text.length <= maxFastChars;
+
+    let result = null;
+    let escalated = false;
+    if (useFast) {
+      try {
+        result = await callRoute("fast", buildPrompt(text, true), isValid);
+      } catch (err) {
+        console.warn("Быстрая модель GPT не ответила:", err.message);
+      }
+      if (!result || !result.ok) {
+        escalated = true;
+        escalations += 1;
+        result = null;
+      }
+    }
+    if (!result) {
+      result = await callRoute("strong", buildPrompt(text, false), isValid);
+    }
+
+    const routing = {
+      route: escalated ? "fast->strong" : useFast ? "fast" : "strong",
+      text_quality: quality.score,
+      latency_ms: Date.now() - started,
+    };
+    console.log("GPT маршрут:", JSON.stringify({ ...routing, quality_flags: quality.flags, stats: stats() }));
+    return { data: result.data, routing };
+  }
+
+  return { extract, stats };
+}
+
+module.exports = {
+  MIN_FAST_ROUTE_QUALITY,
+  assessDocumentText,
+  createGptRouter,
+  modelRoutes,
+};
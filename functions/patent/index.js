@@ -1,4 +1,5 @@
 const axios = require("axios");
+const { assessDocumentText, createGptRouter, modelRoutes } = require("./gpt-routing");
 
 // ============================================================================
 // КОНСТАНТЫ И КОНФИГУРАЦИЯ
@@ -11,6 +12,10 @@ const GPT_ENDPOINT = "https://llm.api.cloud.yandex.net/foundationModels/v1/compl
 const MIN_IMAGE_SIZE = 10240; // 10KB
 const MAX_IMAGE_SIZE = 4194304; // 4MB
 
+// Маршруты GPT (gpt-routing.js): лимиты токенов быстрой и большой модели
+const GPT_ROUTES = modelRoutes(150, 400);
+const MAX_FAST_ROUTE_CHARS = 2500; // длинный текст не помещается в короткий бюджет
+
 // ============================================================================
 // ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
 // ============================================================================
@@ -105,13 +110,20 @@ async function callYandexVision(imageBuffer) {
 }
 
 /**
- * Вызов Yandex GPT API для извлечения данных из патента
+ * Промпт для извлечения данных из патента
+ * @param {string} recognizedText - Распознанный текст
+ * @param {boolean} compact - Короткий промпт для быстрой модели
  */
-async function extractPatentDataWithGPT(recognizedText) {
-  const apiKey = process.env.YANDEX_GPT_API_KEY;
-  const folderId = process.env.YANDEX_FOLDER_ID;
+function buildPatentPrompt(recognizedText, compact) {
+  if (compact) {
+    return `Извлеки из текста патента на работу ФИО, гражданство и номер документа. Если в номере есть "/", возьми только часть до "/" без пробелов. Верни ТОЛЬКО JSON:
+{"full_name": "Фамилия Имя Отчество", "citizenship": "", "document_number": ""}
+
+Текст:
+${recognizedText}`;
+  }
 
-  const prompt = `Ты - система извлечения данных из патента на работу. Извлеки строго следующие поля:
+  return `Ты - система извлечения данных из патента на работу. Извлеки строго следующие поля:
 
 1. full_name - ФИО в одной строке (Фамилия Имя Отчество)
 
@@ -156,13 +168,24 @@ async function extractPatentDataWithGPT(recognizedText) {
 ${recognizedText}
 
 Не добавляй никаких пояснений, только JSON.`;
+}
+
+/**
+ * Вызов Yandex GPT API для извлечения данных из патента
+ * @param {string} prompt - Промпт
+ * @param {string} routeName - Маршрут из GPT_ROUTES (модель и лимит токенов)
+ */
+async function callYandexGPT(prompt, routeName) {
+  const apiKey = process.env.YANDEX_GPT_API_KEY;
+  const folderId = process.env.YANDEX_FOLDER_ID;
+  const route = GPT_ROUTES[routeName];
 
   const payload = {
-    modelUri: `gpt://${folderId}/yandexgpt-lite`,
+    modelUri: `gpt://${folderId}/${route.model}`,
     completionOptions: {
       stream: false,
       temperature: 0.1,
-      maxTokens: 400,
+      maxTokens: route.maxTokens,
     },
     messages: [
       {
@@ -195,6 +218,15 @@ ${recognizedText}
   }
 }
 
+/**
+ * Проверка ответа GPT: все поля заполнены, номер найден
+ */
+function isValidPatentData(data) {
+  if (!data || data.error) return false;
+  const filled = ["full_name", "citizenship", "document_number"].every((field) => data[field]);
+  return filled && data.document_number !== "не указан" && !String(data.document_number).includes("/");
+}
+
 /**
  * Валидация номера документа патента
  */
@@ -214,6 +246,27 @@ function validateDocumentNumber(docNumber) {
   return true;
 }
 
+// ============================================================================
+// МАРШРУТИЗАЦИЯ МОДЕЛЕЙ GPT
+// ============================================================================
+//
+// Выбор модели и статистика - в gpt-routing.js; здесь признаки нормально
+// распознанного документа.
+
+// Метки полей, по которым видно, что текст распознан нормально
+const EXPECTED_LABELS = [
+  /ПАТЕНТ/i,
+  /ГРАЖДАНСТВО/i,
+  /ФАМИЛИЯ|Ф\.?\s?И\.?\s?О/i,
+  /\d{5,}\s*\/\s*\d+/,
+];
+
+const gptRouter = createGptRouter({
+  callModel: callYandexGPT,
+  assessTextQuality: (text) => assessDocumentText(text, EXPECTED_LABELS, MAX_FAST_ROUTE_CHARS),
+  maxFastChars: MAX_FAST_ROUTE_CHARS,
+});
+
 // ============================================================================
 // ОСНОВНАЯ ФУНКЦИЯ
 // ============================================================================
@@ -322,8 +375,11 @@ exports.handler = async function (event, context) {
 
     // Извлечение данных через GPT
     let patentData;
+    let gptRouting;
     try {
-      patentData = await extractPatentDataWithGPT(recognizedText);
+      const extraction = await gptRouter.extract(recognizedText, buildPatentPrompt, isValidPatentData);
+      patentData = extraction.data;
+      gptRouting = extraction.routing;
     } catch (err) {
       console.error("GPT API error:", err);
       return {
@@ -380,6 +436,9 @@ exports.handler = async function (event, context) {
         full_name: patentData.full_name,
         citizenship: patentData.citizenship,
         document_number: patentData.document_number,
+        processing_info: {
+          gpt_routing: gptRouting,
+        },
       }),
     };
   } catch (error) {
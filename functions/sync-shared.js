@@ -0,0 +1,36 @@
+// Копирование общих модулей (functions/shared) в папки функций.
+// Каждая функция развертывается отдельным архивом своей папки, поэтому
+// общий код должен лежать рядом с index.js.
+//
+//   node functions/sync-shared.js          - обновить копии
+//   node functions/sync-shared.js --check  - проверить, что копии не разошлись
+
+const fs = require("fs");
+const path = require("path");
+
+const SHARED_DIR = path.join(__dirname, "shared");
+const FUNCTIONS = ["passport", "license", "patent", "audio"];
+
+const check = process.argv.includes("--check");
+let stale = 0;
+
+for (const file of fs.readdirSync(SHARED_DIR)) {
+  const source = fs.readFileSync(path.join(SHARED_DIR, file));
+  for (const name of FUNCTIONS) {
+    const target = path.join(__dirname, name, file);
+    const current = fs.existsSync(target) ? fs.readFileSync(target) : null;
+    if (current && current.equals(source)) continue;
+    if (check) {
+      console.error(`${name}/${file} отличается от shared/${file}`);
+      stale += 1;
+    } else {
+      fs.writeFileSync(target, source);
+      console.log(`${name}/${file} обновлен`);
+    }
+  }
+}
+
+if (stale > 0) {
+  console.error("Запустите: node functions/sync-shared.js");
+  process.exit(1);
+}
@@ -0,0 +1,137 @@
+"""
+Локальная проверка качества фото документа до отправки в облако.
+
+Дешёвые проверки (разрешение и размер файла из метаданных Telegram) не
+требуют скачивания. После скачивания проверяются сигнатура формата (как
+validateImageFormat в функциях), размер, резкость (дисперсия лапласиана)
+и экспозиция (средняя яркость и доля пересвеченных/провалившихся пикселей).
+
+Светлый фон документа сам по себе не проблема: пересвеченным фото
+считается, только если большая часть кадра выбита в белое и при этом
+не видно деталей (низкая резкость). Высокая средняя яркость - лишь
+предупреждение.
+
+Резкость и экспозиция считаются только при установленном Pillow; без него
+остаются проверки формата, размера и разрешения.
+"""
+
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Dict, List, Optional
+
+try:
+    from PIL import Image, ImageFilter, ImageStat
+except ImportError:  # Pillow необязателен
+    Image = None
+
+# Те же лимиты, что и в Cloud Functions
+MIN_IMAGE_SIZE = 10240  # 10KB
+MAX_IMAGE_SIZE = 4194304  # 4MB
+
+MIN_LONG_SIDE = 640
+MIN_SHORT_SIDE = 480
+
+# Размер, до которого уменьшается изображение перед анализом
+ANALYSIS_SIDE = 800
+
+# Дисперсия лапласиана: ниже REJECT - отказ, ниже WARN - предупреждение
+SHARPNESS_REJECT = 15.0
+SHARPNESS_WARN = 50.0
+
+# Средняя яркость (0-255) и доля "клиппированных" пикселей
+BRIGHTNESS_MIN = 40.0
+BRIGHTNESS_MAX = 225.0
+CLIPPED_WARN = 0.4
+# Доля выбитых в белое пикселей, при которой фото без деталей отклоняется
+HIGHLIGHTS_REJECT = 0.6
+
+_LAPLACIAN = (0, 1, 0, 1, -4, 1, 0, 1, 0)
+
+IMAGE_SIGNATURES = (
+    b"\xff\xd8\xff",  # JPEG
+    b"\x89PNG",  # PNG
+    b"GIF8",  # GIF
+)
+
+
+@dataclass
+class QualityReport:
+    problems: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+    metrics: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+
+def check_photo_metadata(width: int, height: int, file_size: Optional[int]) -> List[str]:
+    """Проверки по метаданным Telegram - без скачивания файла"""
+    problems = []
+    if max(width, height) < MIN_LONG_SIDE or min(width, height) < MIN_SHORT_SIDE:
+        problems.append(f"слишком маленькое разрешение ({width}×{height})")
+    if file_size and file_size > MAX_IMAGE_SIZE:
+        problems.append("файл больше 4 МБ")
+    return problems
+
+
+def assess_image(data: bytes) -> QualityReport:
+    """Полная проверка скачанного изображения (выполняется в пуле потоков)"""
+    report = QualityReport()
+
+    if not data.startswith(IMAGE_SIGNATURES):
+        report.problems.append("неподдерживаемый формат (нужен JPEG, PNG или GIF)")
+        return report
+    if len(data) < MIN_IMAGE_SIZE:
+        report.problems.append("файл слишком маленький")
+    elif len(data) > MAX_IMAGE_SIZE:
+        report.problems.append("файл больше 4 МБ")
+
+    if Image is None:
+        return report
+
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image.draft("L", (ANALYSIS_SIDE, ANALYSIS_SIDE))
+            gray = image.convert("L")
+    except (OSError, ValueError):
+        report.problems.append("изображение повреждено")
+        return report
+
+    gray.thumbnail((ANALYSIS_SIDE, ANALYSIS_SIDE))
+
+    edges = gray.filter(ImageFilter.Kernel((3, 3), _LAPLACIAN, scale=1, offset=128))
+    # Kernel не обрабатывает крайние пиксели (они остаются исходными) -
+    # без обрезки ровный кадр выглядел бы "резким"
+    width, height = edges.size
+    edges = edges.crop((1, 1, width - 1, height - 1))
+    sharpness = ImageStat.Stat(edges).var[0]
+    brightness = ImageStat.Stat(gray).mean[0]
+    histogram = gray.histogram()
+    total = sum(histogram) or 1
+    highlights = sum(histogram[250:]) / total
+    clipped = sum(histogram[:6]) / total + highlights
+
+    report.metrics.update(
+        sharpness=round(sharpness, 1),
+        brightness=round(brightness, 1),
+        clipped=round(clipped, 3),
+        highlights=round(highlights, 3),
+    )
+
+    if sharpness < SHARPNESS_REJECT:
+        report.problems.append("фото размыто")
+    elif sharpness < SHARPNESS_WARN:
+        report.warnings.append("фото может быть недостаточно резким")
+
+    if brightness < BRIGHTNESS_MIN:
+        report.problems.append("фото слишком тёмное")
+    elif highlights > HIGHLIGHTS_REJECT and sharpness < SHARPNESS_WARN:
+        # Кадр выбит в белое и деталей не видно - текст не прочитать
+        report.problems.append("фото пересвечено")
+    elif brightness > BRIGHTNESS_MAX:
+        report.warnings.append("фото очень светлое")
+    elif clipped > CLIPPED_WARN:
+        report.warnings.append("есть блики или сильные тени")
+
+    return report
@@ -0,0 +1,331 @@
+"""
+Исходящие сообщения бота с учётом лимитов Telegram.
+
+Все отправки проходят через два token bucket: для конкретного чата
+(~1 сообщение в секунду) и общий для бота (~30 сообщений в секунду).
+При ответе 429 (RetryAfter) чат ставится на паузу на указанное время,
+после чего запрос повторяется. Ожидание лимитов происходит в отдельном
+потоке-планировщике: вызывающий поток (обработчик) его не ждёт.
+
+Сообщение о прогрессе ("⌛ Распознаю...") редактируется на месте,
+включая итог: на одно фото уходит два запроса (send + edit).
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from telegram import InlineKeyboardMarkup, Message
+from telegram.error import BadRequest, RetryAfter
+
+# ============================================================================
+# ЛИМИТЫ
+# ============================================================================
+
+PER_CHAT_RATE = 1.0  # сообщений в секунду в один чат
+PER_CHAT_BURST = 3
+GLOBAL_RATE = 30.0  # сообщений в секунду на бота
+GLOBAL_BURST = 30
+MAX_RETRIES = 3
+SENDER_WORKERS = 4  # одновременных запросов к Bot API на бота
+MAX_CHAT_BUCKETS = 10000
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# TOKEN BUCKET
+# ============================================================================
+
+class TokenBucket:
+    """Потокобезопасный token bucket с резервированием токенов"""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def available_in(self) -> float:
+        """Через сколько секунд появится токен (0 - уже есть)"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            delay = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+            return max(delay, self._paused_until - now)
+
+    def try_acquire(self) -> bool:
+        """Занять токен, только если он доступен прямо сейчас"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens < 1 or self._paused_until > now:
+                return False
+            self._tokens -= 1
+            return True
+
+    def refund(self) -> None:
+        """Вернуть токен, который не понадобился"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+    def pause(self, seconds: float) -> None:
+        """Запретить отправку на заданное время (после RetryAfter)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def is_idle(self) -> bool:
+        """Bucket полон и не на паузе — его можно выбросить"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return self._tokens >= self.capacity and self._paused_until <= now
+
+
+# ============================================================================
+# ПЛАНИРОВЩИК ОТПРАВКИ
+# ============================================================================
+
+class _Job:
+    __slots__ = ("func", "kwargs", "future", "attempts")
+
+    def __init__(self, func: Callable[..., Any], kwargs: Dict[str, Any]) -> None:
+        self.func = func
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.attempts = 0
+
+
+class OutboundMessenger:
+    """
+    Отправка, редактирование и прогресс-сообщения через лимиты Telegram.
+
+    Вызовы Bot API ставятся в очередь своего чата и возвращают Future, так
+    что обработчики (в том числе в единственном потоке диспетчера) не ждут
+    лимитов. Поток-планировщик выбирает чаты, для которых есть токены, и
+    передаёт запросы пулу отправителей; внутри чата порядок сохраняется.
+    """
+
+    def __init__(
+        self,
+        bot: Any,
+        per_chat_rate: float = PER_CHAT_RATE,
+        per_chat_burst: float = PER_CHAT_BURST,
+        global_rate: float = GLOBAL_RATE,
+        global_burst: float = GLOBAL_BURST,
+        max_retries: int = MAX_RETRIES,
+        workers: int = SENDER_WORKERS,
+    ) -> None:
+        self.bot = bot
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._chats_lock = threading.Lock()
+
+        self._cond = threading.Condition()
+        self._queues: Dict[int, Deque[_Job]] = {}
+        self._ready: List[Tuple[float, int, int]] = []  # (когда, порядок, чат)
+        self._scheduled: Set[int] = set()
+        self._busy: Set[int] = set()
+        self._seq = itertools.count()
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="outbound")
+        self._thread = threading.Thread(target=self._loop, name="outbound-scheduler", daemon=True)
+        self._thread.start()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        with self._chats_lock:
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                if len(self._chats) >= MAX_CHAT_BUCKETS:
+                    self._chats = {
+                        key: value for key, value in self._chats.items() if not value.is_idle()
+                    }
+                bucket = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+                self._chats[chat_id] = bucket
+            return bucket
+
+    def _schedule(self, chat_id: int, when: float) -> None:
+        # Вызывается под self._cond; каждый чат стоит в расписании не более раза
+        if chat_id in self._scheduled or chat_id in self._busy or not self._queues.get(chat_id):
+            return
+        self._scheduled.add(chat_id)
+        heapq.heappush(self._ready, (when, next(self._seq), chat_id))
+        self._cond.notify()
+
+    def _submit(self, target_chat: int, func: Callable[..., Any], **kwargs: Any) -> Future:
+        """Поставить вызов Bot API в очередь чата"""
+        job = _Job(func, kwargs)
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Outbound messenger is shut down")
+            self._queues.setdefault(target_chat, deque()).append(job)
+            self._schedule(target_chat, time.monotonic())
+        return job.future
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped and not self._queues:
+                        return
+                    now = time.monotonic()
+                    if self._ready and self._ready[0][0] <= now:
+                        break
+                    self._cond.wait(self._ready[0][0] - now if self._ready else None)
+
+                _, _, chat_id = heapq.heappop(self._ready)
+                self._scheduled.discard(chat_id)
+                bucket = self._chat_bucket(chat_id)
+                wait = max(bucket.available_in(), self._global.available_in())
+                if wait > 0 or not bucket.try_acquire():
+                    self._schedule(chat_id, now + max(wait, 0.01))
+                    continue
+                if not self._global.try_acquire():
+                    bucket.refund()
+                    self._schedule(chat_id, now + 0.01)
+                    continue
+                job = self._queues[chat_id].popleft()
+                self._busy.add(chat_id)
+            self._executor.submit(self._execute, chat_id, bucket, job)
+
+    def _execute(self, chat_id: int, bucket: TokenBucket, job: _Job) -> None:
+        retry = False
+        # При повторе после RetryAfter Future уже в состоянии RUNNING
+        if job.future.running() or job.future.set_running_or_notify_cancel():
+            try:
+                job.future.set_result(job.func(**job.kwargs))
+            except RetryAfter as exc:
+                if job.attempts < self.max_retries:
+                    logger.warning("Flood control for chat %s, retry in %.1fs", chat_id, exc.retry_after)
+                    bucket.pause(float(exc.retry_after))
+                    job.attempts += 1
+                    retry = True
+                else:
+                    job.future.set_exception(exc)
+            except BaseException as exc:
+                job.future.set_exception(exc)
+        with self._cond:
+            self._busy.discard(chat_id)
+            queue = self._queues[chat_id]
+            if retry:
+                # Повтор идёт первым, чтобы не нарушить порядок сообщений чата
+                queue.appendleft(job)
+            if queue:
+                self._schedule(chat_id, time.monotonic())
+            else:
+                del self._queues[chat_id]
+            self._cond.notify_all()
+
+    def send(self, chat_id: int, text: str, **kwargs: Any) -> Future:
+        """Отправить новое сообщение (Future с Message)"""
+        return self._submit(chat_id, self.bot.send_message, chat_id=chat_id, text=text, **kwargs)
+
+    def _edit_message_text(self, **kwargs: Any) -> Optional[Message]:
+        try:
+            return self.bot.edit_message_text(**kwargs)
+        except BadRequest as exc:
+            if "not modified" in str(exc).lower():
+                return None
+            raise
+
+    def edit(self, chat_id: int, message_id: int, text: str, **kwargs: Any) -> Future:
+        """Отредактировать сообщение; неизменённый текст не считается ошибкой"""
+        return self._submit(
+            chat_id, self._edit_message_text, chat_id=chat_id, message_id=message_id, text=text, **kwargs
+        )
+
+    def try_edit(self, chat_id: int, message_id: int, text: str, **kwargs: Any) -> bool:
+        """
+        Отредактировать сообщение без ожидания лимитов.
+
+        Для необязательных обновлений (промежуточный текст): если токена нет
+        или чат на паузе, edit пропускается, а не ждёт. Возвращает True,
+        если сообщение отредактировано.
+        """
+        bucket = self._chat_bucket(chat_id)
+        if not bucket.try_acquire():
+            return False
+        if not self._global.try_acquire():
+            bucket.refund()
+            return False
+        try:
+            self._edit_message_text(chat_id=chat_id, message_id=message_id, text=text, **kwargs)
+        except RetryAfter as exc:
+            bucket.pause(float(exc.retry_after))
+            return False
+        return True
+
+    def progress(self, chat_id: int, text: str) -> "ProgressMessage":
+        """Отправить сообщение о прогрессе, которое дальше редактируется на месте"""
+        return ProgressMessage(self, chat_id, self.send(chat_id, text), text)
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """Отправить уже поставленные сообщения и остановить планировщик"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=True)
+
+
+class ProgressMessage:
+    """Сообщение "⌛ ...", которое обновляется вместо отправки новых"""
+
+    def __init__(self, messenger: OutboundMessenger, chat_id: int, sent: Future, text: str) -> None:
+        self.messenger = messenger
+        self.chat_id = chat_id
+        self.text = text
+        self._sent = sent
+
+    @property
+    def message(self) -> Message:
+        """Отправленное сообщение прогресса (ждёт, пока оно уйдёт из очереди)"""
+        return self._sent.result()
+
+    def update(self, text: str, **kwargs: Any) -> None:
+        """Заменить текст прогресса"""
+        if text == self.text:
+            return
+        self.messenger.edit(self.chat_id, self.message.message_id, text, **kwargs).result()
+        self.text = text
+
+    def try_update(self, text: str) -> bool:
+        """Заменить текст прогресса, если это можно сделать без ожидания лимитов"""
+        if text == self.text:
+            return True
+        if not self._sent.done() or self._sent.exception() is not None:
+            return False
+        if not self.messenger.try_edit(self.chat_id, self.message.message_id, text):
+            return False
+        self.text = text
+        return True
+
+    def finish(self, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None, **kwargs: Any) -> Future:
+        """
+        Показать итог на месте сообщения о прогрессе.
+
+        Edit принимает только inline-клавиатуру; reply-клавиатуру вызывающий
+        код показывает заранее или отдельным сообщением. Если отредактировать
+        не удалось, итог уходит новым сообщением.
+        """
+        try:
+            self.update(text, reply_markup=reply_markup, **kwargs)
+            return self._sent
+        except BadRequest:
+            logger.warning("Could not edit progress message, sending a new one")
+        return self.messenger.send(self.chat_id, text, reply_markup=reply_markup, **kwargs)
@@ -0,0 +1,147 @@
+"""
+Профилирование работающего бота без перезапуска.
+
+На заданное окно включаются семплирующий профайлер (снимки стеков всех
+потоков через sys._current_frames) и tracemalloc. По окончании окна на диск
+пишутся:
+
+- profile-<время>.collapsed — стеки в формате flamegraph.pl / speedscope;
+- profile-<время>.txt — топ функций по собственному и суммарному времени;
+- alloc-<время>.txt — топ мест выделения памяти и прирост за окно.
+
+Пока профилирование выключено, никакой работы не выполняется.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Callable, List, Optional
+
+DEFAULT_INTERVAL = 0.005  # секунды между снимками стеков
+TRACEMALLOC_FRAMES = 10
+TOP_LIMIT = 30
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+
+class RuntimeProfiler:
+    """Семплирующий профайлер и tracemalloc, включаемые на время"""
+
+    def __init__(self, output_dir: str, interval: float = DEFAULT_INTERVAL) -> None:
+        self.output_dir = output_dir
+        self.interval = interval
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(
+        self,
+        duration: float,
+        on_done: Optional[Callable[[List[str]], None]] = None,
+    ) -> bool:
+        """Запустить профилирование на duration секунд; False если уже идёт"""
+        with self._lock:
+            if self.is_running:
+                return False
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(duration, on_done),
+                name="runtime-profiler",
+                daemon=True,
+            )
+            self._thread.start()
+            return True
+
+    def _run(self, duration: float, on_done: Optional[Callable[[List[str]], None]]) -> None:
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        baseline = tracemalloc.take_snapshot()
+
+        stacks: Counter = Counter()
+        samples = 0
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + duration
+        logger.info("Profiling started for %.0fs", duration)
+
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                stacks[";".join(reversed(labels))] += 1
+            samples += 1
+            time.sleep(self.interval)
+
+        snapshot = tracemalloc.take_snapshot()
+        if started_tracing:
+            tracemalloc.stop()
+
+        try:
+            paths = self._write(stacks, samples, baseline, snapshot)
+        except OSError:
+            logger.exception("Could not write profiling results")
+            paths = []
+        logger.info("Profiling finished: %s", ", ".join(paths))
+        if on_done:
+            on_done(paths)
+
+    def _write(self, stacks: Counter, samples: int, baseline, snapshot) -> List[str]:
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        collapsed_path = os.path.join(self.output_dir, f"profile-{stamp}.collapsed")
+        summary_path = os.path.join(self.output_dir, f"profile-{stamp}.txt")
+        alloc_path = os.path.join(self.output_dir, f"alloc-{stamp}.txt")
+
+        with open(collapsed_path, "w", encoding="utf-8") as fh:
+            for stack, count in stacks.most_common():
+                fh.write(f"{stack} {count}\n")
+
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in stacks.items():
+            labels = stack.split(";")
+            own[labels[-1]] += count
+            for label in set(labels):
+                total[label] += count
+        all_samples = sum(stacks.values()) or 1
+
+        with open(summary_path, "w", encoding="utf-8") as fh:
+            fh.write(f"samples: {samples}, stacks: {all_samples}\n\n")
+            fh.write("Top by own time:\n")
+            for label, count in own.most_common(TOP_LIMIT):
+                fh.write(f"{100 * count / all_samples:6.2f}%  {label}\n")
+            fh.write("\nTop by total time:\n")
+            for label, count in total.most_common(TOP_LIMIT):
+                fh.write(f"{100 * count / all_samples:6.2f}%  {label}\n")
+
+        with open(alloc_path, "w", encoding="utf-8") as fh:
+            fh.write("Top allocation sites (current):\n")
+            for stat in snapshot.statistics("lineno")[:TOP_LIMIT]:
+                fh.write(f"{stat}\n")
+            fh.write("\nTop growth during the window:\n")
+            for stat in snapshot.compare_to(baseline, "lineno")[:TOP_LIMIT]:
+                fh.write(f"{stat}\n")
+            fh.write("\nTop allocation tracebacks:\n")
+            for stat in snapshot.statistics("traceback")[:5]:
+                fh.write(f"{stat}\n")
+                for line in stat.traceback.format():
+                    fh.write(f"{line}\n")
+                fh.write("\n")
+
+        return [collapsed_path, summary_path, alloc_path]
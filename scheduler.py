@@ -0,0 +1,203 @@
+"""
+Планировщик исходящих запросов на распознавание.
+
+Число одновременных обращений к Cloud Functions ограничено пулом воркеров,
+а порядок выполнения задаётся так:
+
+- классы приоритета: шаги, близкие к завершению (голосовое), идут раньше
+  новых документов;
+- внутри класса — взвешенная справедливая очередь (WFQ) по пользователям:
+  у каждого пользователя своя "виртуальная" очередь, поэтому один активный
+  пользователь не забирает всю пропускную способность;
+- защита от голодания: задача, прождавшая дольше starvation_timeout,
+  выполняется первой независимо от класса.
+
+Для каждого класса собирается время ожидания в очереди (p50/p99).
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+PRIORITY_FINAL = 0  # последний шаг: голосовое сообщение
+PRIORITY_FOLLOWUP = 1  # продолжение начатого документа (вторая сторона прав)
+PRIORITY_NEW = 2  # новый документ
+
+PRIORITY_NAMES = {
+    PRIORITY_FINAL: "final",
+    PRIORITY_FOLLOWUP: "followup",
+    PRIORITY_NEW: "new",
+}
+
+DEFAULT_WORKERS = 4
+DEFAULT_STARVATION_TIMEOUT = 15.0
+WAIT_SAMPLES = 1000
+
+
+class _Task:
+    __slots__ = ("priority", "user_id", "func", "args", "kwargs", "future", "enqueued_at", "taken")
+
+    def __init__(self, priority: int, user_id: Any, func: Callable[..., Any], args: tuple, kwargs: dict) -> None:
+        self.priority = priority
+        self.user_id = user_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+        self.taken = False
+
+
+class _PriorityClass:
+    """Очередь одного класса приоритета: WFQ-куча и очередь по времени прихода"""
+
+    def __init__(self) -> None:
+        self.heap: List[Tuple[float, int, _Task]] = []
+        self.arrivals: Deque[_Task] = deque()
+        self.virtual_time = 0.0
+        self.last_finish: Dict[Any, float] = {}
+        self.pending = 0
+        self.waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self.completed = 0
+
+    def push(self, task: _Task, cost: float, weight: float, seq: int) -> None:
+        start = max(self.virtual_time, self.last_finish.get(task.user_id, 0.0))
+        finish = start + cost / weight
+        self.last_finish[task.user_id] = finish
+        heapq.heappush(self.heap, (finish, seq, task))
+        self.arrivals.append(task)
+        self.pending += 1
+
+    def oldest(self) -> Optional[_Task]:
+        while self.arrivals and self.arrivals[0].taken:
+            self.arrivals.popleft()
+        return self.arrivals[0] if self.arrivals else None
+
+    def pop_fair(self) -> _Task:
+        while True:
+            finish, _, task = heapq.heappop(self.heap)
+            if not task.taken:
+                self.virtual_time = max(self.virtual_time, finish)
+                return task
+
+    def forget_idle_users(self) -> None:
+        # Очередь пуста: теги пользователей и устаревшие записи больше не нужны
+        if self.pending == 0:
+            self.last_finish.clear()
+            self.heap.clear()
+            self.arrivals.clear()
+
+
+class RecognitionScheduler:
+    """Приоритетная справедливая очередь запросов с пулом воркеров"""
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        starvation_timeout: float = DEFAULT_STARVATION_TIMEOUT,
+        weight_for: Optional[Callable[[Any], float]] = None,
+    ) -> None:
+        self.starvation_timeout = starvation_timeout
+        self.weight_for = weight_for or (lambda user_id: 1.0)
+        self._classes = {priority: _PriorityClass() for priority in PRIORITY_NAMES}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"recognition-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(
+        self,
+        priority: int,
+        user_id: Any,
+        func: Callable[..., Any],
+        *args: Any,
+        cost: float = 1.0,
+        **kwargs: Any,
+    ) -> Future:
+        """Поставить вызов func(*args, **kwargs) в очередь"""
+        task = _Task(priority, user_id, func, args, kwargs)
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Scheduler is shut down")
+            weight = max(self.weight_for(user_id), 0.01)
+            self._classes[priority].push(task, cost, weight, next(self._seq))
+            self._cond.notify()
+        return task.future
+
+    def run(self, priority: int, user_id: Any, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Выполнить вызов через очередь и дождаться результата"""
+        return self.submit(priority, user_id, func, *args, **kwargs).result()
+
+    def _next_task(self) -> Optional[_Task]:
+        now = time.monotonic()
+
+        # Защита от голодания: самая старая задача, прождавшая слишком долго
+        starving: Optional[_Task] = None
+        for queue in self._classes.values():
+            oldest = queue.oldest()
+            if oldest and now - oldest.enqueued_at >= self.starvation_timeout:
+                if starving is None or oldest.enqueued_at < starving.enqueued_at:
+                    starving = oldest
+
+        if starving is not None:
+            task = starving
+        else:
+            queue = next((q for _, q in sorted(self._classes.items()) if q.pending), None)
+            if queue is None:
+                return None
+            task = queue.pop_fair()
+
+        task.taken = True
+        queue = self._classes[task.priority]
+        queue.pending -= 1
+        queue.waits.append(now - task.enqueued_at)
+        queue.forget_idle_users()
+        return task
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    if self._stopped:
+                        return
+                    self._cond.wait()
+                    task = self._next_task()
+
+            if not task.future.set_running_or_notify_cancel():
+                continue
+            try:
+                task.future.set_result(task.func(*task.args, **task.kwargs))
+            except BaseException as exc:
+                task.future.set_exception(exc)
+            with self._cond:
+                self._classes[task.priority].completed += 1
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Длина очереди и время ожидания (сек) по классам приоритета"""
+        result = {}
+        with self._cond:
+            for priority, queue in sorted(self._classes.items()):
+                waits = sorted(queue.waits)
+                result[PRIORITY_NAMES[priority]] = {
+                    "queued": queue.pending,
+                    "completed": queue.completed,
+                    "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+                    "wait_p99": waits[min(len(waits) - 1, int(len(waits) * 0.99))] if waits else 0.0,
+                }
+        return result
+
+    def shutdown(self) -> None:
+        """Остановить воркеры после выполнения уже поставленных задач"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
@@ -3,20 +3,43 @@ import json
 import base64
 import logging
 import re
-from typing import Dict, Any, List
+import signal
+import time
+from typing import Callable, Dict, Any, List, Optional, Tuple
 from datetime import datetime, timezone
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 
 import requests
-from telegram import Update, ParseMode, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from telegram import (
+    Bot, Update, Message, PhotoSize, ParseMode, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove,
+    InlineKeyboardButton, InlineKeyboardMarkup,
+)
+from telegram.error import TelegramError
+from telegram.utils.request import Request
 from telegram.ext import (
     Updater,
     CommandHandler,
     MessageHandler,
+    MessageFilter,
     Filters,
     CallbackContext,
+    CallbackQueryHandler,
     ConversationHandler,
 )
 
+from document_store import DocumentStore
+from endpoints import EndpointPool, parse_urls, start_health_checks
+from image_quality import QualityReport, assess_image, check_photo_metadata
+from outbound import SENDER_WORKERS, OutboundMessenger, ProgressMessage
+from profiling import RuntimeProfiler
+from scheduler import (
+    PRIORITY_FINAL,
+    PRIORITY_FOLLOWUP,
+    PRIORITY_NEW,
+    RecognitionScheduler,
+)
+from tenants import Tenant, load_tenants
+
 # ============================================================================
 # КОНФИГУРАЦИЯ
 # ============================================================================
@@ -27,6 +50,45 @@ LICENSE_FUNCTION_URL = os.getenv("LICENSE_FUNCTION_URL", "https://functions.yand
 PATENT_FUNCTION_URL = os.getenv("PATENT_FUNCTION_URL", "https://functions.yandexcloud.net/999")
 AUDIO_FUNCTION_URL = os.getenv("AUDIO_FUNCTION_URL", "https://functions.yandexcloud.net/999")
 
+# В *_FUNCTION_URL можно указать несколько адресов через запятую (регионы,
+# версии). JSON-файл {"passport": [url, ...], ...} переопределяет их и
+# перечитывается при изменении или по SIGHUP без перезапуска бота
+FUNCTION_ENDPOINTS_FILE = os.getenv("FUNCTION_ENDPOINTS_FILE")
+
+# Несколько ботов в одном процессе: JSON-файл со списком ботов (см. tenants.py).
+# Без него работает один бот с TELEGRAM_BOT_TOKEN и адресами выше
+BOTS_CONFIG_FILE = os.getenv("BOTS_CONFIG_FILE")
+
+# Администраторы (через запятую; им доступны /profile и /stats) и каталог для профилей
+ADMIN_USER_IDS = {int(uid) for uid in os.getenv("ADMIN_USER_IDS", "").split(",") if uid.strip()}
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_DEFAULT_SECONDS = 60
+PROFILE_MAX_SECONDS = 600
+
+# Сохранённые документы (по согласию пользователя): ключ Fernet для шифрования,
+# файл SQLite и срок хранения в днях. Без ключа функция выключена
+DOCUMENT_STORE_KEY = os.getenv("DOCUMENT_STORE_KEY")
+DOCUMENT_STORE_PATH = os.getenv("DOCUMENT_STORE_PATH", "saved_documents.db")
+DOCUMENT_STORE_TTL_DAYS = float(os.getenv("DOCUMENT_STORE_TTL_DAYS", "30"))
+
+# Окно сборки альбома (сек) и число потоков для скачивания/распознавания
+ALBUM_ASSEMBLY_WINDOW = float(os.getenv("ALBUM_ASSEMBLY_WINDOW", "1.0"))
+IO_WORKERS = int(os.getenv("IO_WORKERS", "8"))
+QUALITY_WORKERS = int(os.getenv("QUALITY_WORKERS", "2"))
+
+# Одновременных обращений к функциям распознавания, потоков обработчиков
+# Telegram (общий бюджет, делится между ботами) и порог (сек), после которого
+# задача идёт вне очереди приоритетов
+RECOGNITION_WORKERS = int(os.getenv("RECOGNITION_WORKERS", "4"))
+DISPATCHER_WORKERS = int(os.getenv("DISPATCHER_WORKERS", "16"))
+STARVATION_TIMEOUT = float(os.getenv("STARVATION_TIMEOUT", "15"))
+MIN_BOT_WORKERS = 4
+
+# Потоковое распознавание голосовых: промежуточный текст показывается по мере
+# появления, но не чаще PARTIAL_UPDATE_INTERVAL секунд
+AUDIO_STREAMING = os.getenv("AUDIO_STREAMING", "0").lower() in ("1", "true", "yes")
+PARTIAL_UPDATE_INTERVAL = 1.5
+
 # ============================================================================
 # КОНСТАНТЫ И СОСТОЯНИЯ
 # ============================================================================
@@ -36,6 +98,9 @@ DOCUMENT_PASSPORT = "passport"
 DOCUMENT_LICENSE = "license"
 DOCUMENT_PATENT = "patent"
 
+# Функция распознавания голосовых
+FUNCTION_AUDIO = "audio"
+
 # Состояния
 (
     SELECTING_ACTION,
@@ -45,30 +110,100 @@ DOCUMENT_PATENT = "patent"
     TAKING_PATENT_PHOTO,
     TAKING_VOICE,
     SHOWING_RESULTS,
-) = range(7)
+    PROCESSING_ALBUM,
+) = range(8)
+
+# Заголовок и подпись номера в сообщении о распознанном документе
+DOCUMENT_RESULT_LABELS = {
+    DOCUMENT_PASSPORT: ("✅ Паспорт распознан!", "📇 Номер"),
+    DOCUMENT_LICENSE: ("✅ Права распознаны!", "🚗 Номер"),
+    DOCUMENT_PATENT: ("✅ Патент распознан!", "📇 Номер"),
+}
+
+# Кнопки меню документа (на шагах фото и голосового)
+DOCUMENT_MENU_PATTERN = '^(↪️ Назад в меню|📷 Сделать фото|🎤 Отправить голосовое|📂 Использовать сохранённый|💾 Запомнить документ)$'
 
-# Кнопки меню
-MAIN_MENU_KEYBOARD = [
-    ["📄 Паспорт", "🚗 Водительские права"],
-    ["📋 Патент на работу", "❌ Отмена"],
-]
+# callback_data inline-кнопки сохранения документа
+SAVE_DOCUMENT_CALLBACK = "save_document"
+
+# Кнопки главного меню для каждого типа документа
+DOCUMENT_MENU_BUTTONS = {
+    DOCUMENT_PASSPORT: "📄 Паспорт",
+    DOCUMENT_LICENSE: "🚗 Водительские права",
+    DOCUMENT_PATENT: "📋 Патент на работу",
+}
 
 # ============================================================================
 # ХРАНИЛИЩЕ СЕССИЙ
 # ============================================================================
 
-user_sessions: Dict[int, Dict[str, Any]] = {}
+# Сессии всех ботов: ключ - (имя бота, id пользователя)
+user_sessions: Dict[Tuple[str, int], Dict[str, Any]] = {}
+
+# Профилирование включается на время командой /profile или сигналом SIGUSR1
+runtime_profiler = RuntimeProfiler(PROFILE_DIR)
+
+# Пул потоков для параллельного скачивания и распознавания
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+
+# Пул для проверки качества фото (декодирование и фильтры Pillow отпускают GIL)
+quality_executor = ThreadPoolExecutor(max_workers=QUALITY_WORKERS, thread_name_prefix="quality")
+
+# Боты этого процесса; у каждого свои документы и адреса функций, запрос
+# уходит на наименее загруженный и самый быстрый адрес
+tenants: Dict[str, Tenant] = {
+    tenant.name: tenant
+    for tenant in load_tenants(
+        BOTS_CONFIG_FILE,
+        TELEGRAM_BOT_TOKEN,
+        list(DOCUMENT_MENU_BUTTONS),
+        {
+            DOCUMENT_PASSPORT: parse_urls(PASSPORT_FUNCTION_URL),
+            DOCUMENT_LICENSE: parse_urls(LICENSE_FUNCTION_URL),
+            DOCUMENT_PATENT: parse_urls(PATENT_FUNCTION_URL),
+            FUNCTION_AUDIO: parse_urls(AUDIO_FUNCTION_URL),
+        },
+        FUNCTION_ENDPOINTS_FILE,
+    )
+}
+
+
+def tenant_weight(scheduler_key: Tuple[str, int]) -> float:
+    """Вес пользователя в очереди распознавания - вес его бота"""
+    tenant = tenants.get(scheduler_key[0])
+    return tenant.weight if tenant else 1.0
+
+
+# Очередь запросов к функциям: приоритеты, справедливость между пользователями
+# (общая для всех ботов)
+recognition_scheduler = RecognitionScheduler(
+    workers=RECOGNITION_WORKERS,
+    starvation_timeout=STARVATION_TIMEOUT,
+    weight_for=tenant_weight,
+)
+
+# Общие keep-alive соединения с функциями: без повторного TLS-рукопожатия
+http_session = requests.Session()
+http_session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=RECOGNITION_WORKERS))
+
+# Сохранённые документы: повторный сценарий без фото и распознавания
+document_store = DocumentStore(DOCUMENT_STORE_PATH, DOCUMENT_STORE_KEY, DOCUMENT_STORE_TTL_DAYS * 86400)
 
 # ============================================================================
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
 # ============================================================================
 
-def get_session(user_id: int) -> Dict[str, Any]:
+def get_tenant(context: CallbackContext) -> Tenant:
+    """Бот, получивший обновление"""
+    return context.bot_data["tenant"]
+
+
+def get_session(context: CallbackContext, user_id: int) -> Dict[str, Any]:
     """Получить сессию пользователя"""
-    return user_sessions.get(user_id)
+    return user_sessions.get((get_tenant(context).name, user_id))
 
 
-def create_session(user_id: int) -> Dict[str, Any]:
+def create_session(context: CallbackContext, user_id: int) -> Dict[str, Any]:
     """Создать новую сессию"""
     session = {
         "document_type": None,
@@ -76,13 +211,18 @@ def create_session(user_id: int) -> Dict[str, Any]:
         "photos": [],
         "state": SELECTING_ACTION,
     }
-    user_sessions[user_id] = session
+    user_sessions[(get_tenant(context).name, user_id)] = session
     return session
 
 
-def end_session(user_id: int) -> None:
+def is_current_session(context: CallbackContext, user_id: int, session: Dict[str, Any]) -> bool:
+    """Сессия всё ещё активна (пользователь не вернулся в меню и не отменил)"""
+    return get_session(context, user_id) is session
+
+
+def end_session(context: CallbackContext, user_id: int) -> None:
     """Завершить сессию пользователя"""
-    user_sessions.pop(user_id, None)
+    user_sessions.pop((get_tenant(context).name, user_id), None)
 
 
 def normalize_phone_number(phone_number: Any) -> str:
@@ -129,17 +269,42 @@ def get_full_name(document_data: Dict[str, Any], doc_type: str) -> str:
     return ""
 
 
+def get_outbound(context: CallbackContext) -> OutboundMessenger:
+    """Планировщик исходящих сообщений бота"""
+    return context.bot_data["outbound"]
+
+
+def reply(update: Update, context: CallbackContext, text: str, **kwargs: Any):
+    """Ответить в чат с учётом лимитов Telegram"""
+    return get_outbound(context).send(update.effective_chat.id, text, **kwargs)
+
+
+def start_progress(update: Update, context: CallbackContext, text: str) -> ProgressMessage:
+    """Отправить сообщение о прогрессе, которое потом редактируется на месте"""
+    return get_outbound(context).progress(update.effective_chat.id, text)
+
+
+def main_menu_keyboard(context: CallbackContext) -> ReplyKeyboardMarkup:
+    """Главное меню с документами, которые поддерживает этот бот"""
+    buttons = [DOCUMENT_MENU_BUTTONS[doc_type] for doc_type in get_tenant(context).document_types]
+    buttons.append("❌ Отмена")
+    keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+
 def show_main_menu(update: Update, context: CallbackContext) -> int:
     """Показать главное меню"""
-    reply_markup = ReplyKeyboardMarkup(MAIN_MENU_KEYBOARD, resize_keyboard=True)
+    reply_markup = main_menu_keyboard(context)
     if update.message:
-        update.message.reply_text(
+        reply(
+            update, context,
             "👋 Добро пожаловать!\n"
             "📋 Выберите тип документа для распознавания:",
             reply_markup=reply_markup
         )
     else:
-        update.callback_query.message.reply_text(
+        reply(
+            update, context,
             "📋 Выберите тип документа для распознавания:",
             reply_markup=reply_markup
         )
@@ -153,15 +318,16 @@ def show_main_menu(update: Update, context: CallbackContext) -> int:
 def start_command(update: Update, context: CallbackContext) -> int:
     """Обработчик команды /start"""
     user_id = update.effective_user.id
-    create_session(user_id)
+    create_session(context, user_id)
     return show_main_menu(update, context)
 
 
 def cancel_command(update: Update, context: CallbackContext) -> int:
     """Обработчик команды /cancel"""
     user_id = update.effective_user.id
-    end_session(user_id)
-    update.message.reply_text(
+    end_session(context, user_id)
+    reply(
+        update, context,
         "❌ Действие отменено.",
         reply_markup=ReplyKeyboardRemove()
     )
@@ -171,8 +337,8 @@ def cancel_command(update: Update, context: CallbackContext) -> int:
 def back_to_menu(update: Update, context: CallbackContext) -> int:
     """Вернуться в главное меню"""
     user_id = update.effective_user.id
-    end_session(user_id)
-    create_session(user_id)
+    end_session(context, user_id)
+    create_session(context, user_id)
     return show_main_menu(update, context)
 
 
@@ -180,18 +346,38 @@ def back_to_menu(update: Update, context: CallbackContext) -> int:
 # ОБРАБОТЧИКИ КНОПОК
 # ============================================================================
 
+def document_keyboard(context: CallbackContext, user_id: int, doc_type: str) -> ReplyKeyboardMarkup:
+    """
+    Клавиатура документа; с сохранённым документом - кнопка для него.
+
+    Показывается при выборе документа и не меняется до голосового, поэтому
+    результат распознавания редактирует сообщение о прогрессе на месте.
+    """
+    keyboard = [["📷 Сделать фото", "🎤 Отправить голосовое"], ["↪️ Назад в меню"]]
+    if document_store.has(get_tenant(context).name, user_id, doc_type):
+        keyboard.append(["📂 Использовать сохранённый"])
+    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+
 def handle_main_menu_selection(update: Update, context: CallbackContext) -> int:
     """Обработка выбора в главном меню"""
     user_id = update.effective_user.id
-    session = get_session(user_id)
+    session = get_session(context, user_id)
     if not session:
-        session = create_session(user_id)
+        session = create_session(context, user_id)
     text = update.message.text
 
+    # Документ, который этот бот не обслуживает
+    selected = [doc_type for doc_type, button in DOCUMENT_MENU_BUTTONS.items() if button == text]
+    if selected and selected[0] not in get_tenant(context).document_types:
+        reply(update, context, "Пожалуйста, используйте кнопки меню.", reply_markup=main_menu_keyboard(context))
+        return SELECTING_ACTION
+
     if text == "📄 Паспорт":
         session["document_type"] = DOCUMENT_PASSPORT
-        reply_markup = ReplyKeyboardMarkup([["📷 Сделать фото", "↪️ Назад в меню"]], resize_keyboard=True)
-        update.message.reply_text(
+        reply_markup = document_keyboard(context, user_id, DOCUMENT_PASSPORT)
+        reply(
+            update, context,
             "📄 РАСПОЗНАВАНИЕ ПАСПОРТА\n"
             "1. Сделайте четкое фото страницы паспорта\n"
             "2. Отправьте голосовое сообщение с номером телефона и банком\n"
@@ -202,8 +388,9 @@ def handle_main_menu_selection(update: Update, context: CallbackContext) -> int:
 
     elif text == "🚗 Водительские права":
         session["document_type"] = DOCUMENT_LICENSE
-        reply_markup = ReplyKeyboardMarkup([["📷 Сделать фото", "↪️ Назад в меню"]], resize_keyboard=True)
-        update.message.reply_text(
+        reply_markup = document_keyboard(context, user_id, DOCUMENT_LICENSE)
+        reply(
+            update, context,
             "🚗 РАСПОЗНАВАНИЕ ВОДИТЕЛЬСКИХ ПРАВ\n"
             "Нужно отправить ДВА фото:\n"
             "1. Лицевая сторона прав\n"
@@ -216,8 +403,9 @@ def handle_main_menu_selection(update: Update, context: CallbackContext) -> int:
 
     elif text == "📋 Патент на работу":
         session["document_type"] = DOCUMENT_PATENT
-        reply_markup = ReplyKeyboardMarkup([["📷 Сделать фото", "↪️ Назад в меню"]], resize_keyboard=True)
-        update.message.reply_text(
+        reply_markup = document_keyboard(context, user_id, DOCUMENT_PATENT)
+        reply(
+            update, context,
             "📋 РАСПОЗНАВАНИЕ ПАТЕНТА НА РАБОТУ\n"
             "1. Сделайте фото патента\n"
             "2. Отправьте голосовое сообщение с номером телефона и банком\n"
@@ -230,7 +418,7 @@ def handle_main_menu_selection(update: Update, context: CallbackContext) -> int:
         return cancel_command(update, context)
 
     else:
-        update.message.reply_text("Пожалуйста, используйте кнопки меню.")
+        reply(update, context, "Пожалуйста, используйте кнопки меню.")
         return SELECTING_ACTION
 
 
@@ -239,10 +427,23 @@ def handle_document_menu_selection(update: Update, context: CallbackContext) ->
     text = update.message.text
     if text == "↪️ Назад в меню":
         return back_to_menu(update, context)
-    elif text == "📷 Сделать фото":
-        # Состояние уже установлено, просто просим отправить фото
-        update.message.reply_text("Пожалуйста, отправьте фото документа:")
-        return context.user_data.get('current_state', SELECTING_ACTION)
+    session = get_session(context, update.effective_user.id)
+    if not session:
+        return back_to_menu(update, context)
+    if text == "📷 Сделать фото":
+        # Фото можно (пере)отправить и на шаге голосового
+        reply(update, context, "Пожалуйста, отправьте фото документа:")
+        return photo_state(session)
+    elif text == "🎤 Отправить голосовое":
+        if not session.get("document_data"):
+            reply(update, context, "Сначала отправьте фото документа:")
+            return photo_state(session)
+        reply(update, context, "Отправьте голосовое сообщение с номером телефона и банком:")
+        return TAKING_VOICE
+    elif text == "📂 Использовать сохранённый":
+        return use_saved_document(update, context)
+    elif text == "💾 Запомнить документ":
+        return save_document(update, context)
     return SELECTING_ACTION
 
 
@@ -250,20 +451,189 @@ def handle_document_menu_selection(update: Update, context: CallbackContext) ->
 # ОБРАБОТЧИКИ ФОТО И ГОЛОСОВЫХ
 # ============================================================================
 
+def download_file(bot: Any, file_id: str) -> bytes:
+    """Скачать файл из Telegram"""
+    return bytes(bot.get_file(file_id).download_as_bytearray())
+
+
+def encode_base64(data: bytes) -> str:
+    """Закодировать данные в base64 для Cloud Functions"""
+    return base64.b64encode(data).decode('utf-8')
+
+
+def download_as_base64(bot: Any, file_id: str) -> str:
+    """Скачать файл из Telegram и закодировать в base64"""
+    return encode_base64(download_file(bot, file_id))
+
+
+def download_checked_photo(bot: Any, photo: PhotoSize) -> Tuple[Optional[bytes], QualityReport]:
+    """Проверить фото по метаданным, скачать и оценить качество в пуле"""
+    problems = check_photo_metadata(photo.width, photo.height, photo.file_size)
+    if problems:
+        return None, QualityReport(problems=problems)
+    data = download_file(bot, photo.file_id)
+    return data, quality_executor.submit(assess_image, data).result()
+
+
+def format_quality_rejection(report: QualityReport) -> str:
+    """Сообщение об отклонённом фото"""
+    return (
+        f"❌ Фото не подходит: {', '.join(report.problems)}.\n"
+        "Переснимите документ целиком, без бликов, при хорошем освещении и отправьте снова:"
+    )
+
+
+def photo_state(session: Dict[str, Any]) -> int:
+    """Состояние ожидания фото для текущего документа"""
+    doc_type = session.get("document_type")
+    if doc_type == DOCUMENT_PASSPORT:
+        return TAKING_PASSPORT_PHOTO
+    elif doc_type == DOCUMENT_LICENSE:
+        return TAKING_LICENSE_BACK if session.get("photos") else TAKING_LICENSE_FRONT
+    elif doc_type == DOCUMENT_PATENT:
+        return TAKING_PATENT_PHOTO
+    return SELECTING_ACTION
+
+
+def call_function(pool: EndpointPool, payload: Dict[str, Any], timeout: int = 30) -> Dict[str, Any]:
+    """Вызвать Cloud Function и вернуть её JSON-ответ.
+
+    Если адрес недоступен (ошибка соединения), запрос повторяется на
+    следующем адресе той же функции.
+    """
+    tried: List[str] = []
+    while True:
+        try:
+            with pool.request(exclude=tried) as url:
+                tried.append(url)
+                response = http_session.post(url, json=payload, timeout=timeout)
+                response.raise_for_status()
+                return response.json()
+        except requests.ConnectionError:
+            if len(tried) >= len(pool.urls):
+                raise
+            logging.warning("%s endpoint %s unreachable, trying another", pool.name, tried[-1])
+
+
+def stream_function(
+    pool: EndpointPool,
+    payload: Dict[str, Any],
+    on_partial: Callable[[str], None],
+    timeout: int = 60,
+) -> Dict[str, Any]:
+    """Вызвать функцию в потоковом режиме (NDJSON) и вернуть итоговое событие"""
+    result: Dict[str, Any] = {}
+    with pool.request() as url:
+        with http_session.post(url, json={**payload, "stream": True}, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event.get("type") == "partial":
+                    on_partial(event.get("text", ""))
+                else:
+                    result = event
+    return result
+
+
+def submit_call(context: CallbackContext, priority: int, user_id: int, func: Callable[..., Any], *args: Any) -> Future:
+    """Поставить вызов функции в общую очередь в пределах квоты бота"""
+    tenant = get_tenant(context)
+    tenant.acquire()
+    try:
+        future = recognition_scheduler.submit(priority, (tenant.name, user_id), func, *args)
+    except Exception:
+        tenant.release()
+        raise
+    future.add_done_callback(lambda _: tenant.release())
+    return future
+
+
+def submit_recognition(
+    context: CallbackContext,
+    doc_type: str,
+    images: List[str],
+    user_id: int,
+    priority: int = PRIORITY_NEW,
+) -> Future:
+    """Поставить распознавание документа в очередь: одно фото или две стороны прав"""
+    if doc_type == DOCUMENT_LICENSE:
+        payload = {"front_image": images[0], "back_image": images[1]}
+    else:
+        payload = {"image": images[0]}
+    pool = get_tenant(context).endpoints.pool(doc_type)
+    return submit_call(context, priority, user_id, call_function, pool, payload)
+
+
+def recognize_document(
+    context: CallbackContext,
+    doc_type: str,
+    images: List[str],
+    user_id: int,
+    priority: int = PRIORITY_NEW,
+) -> Dict[str, Any]:
+    """Распознать документ через очередь и дождаться ответа"""
+    return submit_recognition(context, doc_type, images, user_id, priority).result()
+
+
+def build_document_data(payload: Dict[str, Any], doc_type: str) -> Dict[str, Any]:
+    """Оставить из ответа функции только нужные боту поля"""
+    if doc_type == DOCUMENT_PASSPORT:
+        return {
+            "last_name": payload.get("last_name", ""),
+            "first_name": payload.get("first_name", ""),
+            "middle_name": payload.get("middle_name", ""),
+            "passport_number": payload.get("passport_number", ""),
+        }
+    elif doc_type == DOCUMENT_LICENSE:
+        return {
+            "full_name": payload.get("full_name", ""),
+            "license_number": payload.get("license_number", ""),
+        }
+    return {
+        "full_name": payload.get("full_name", ""),
+        "document_number": payload.get("document_number", ""),
+    }
+
+
+def format_recognized_message(document_data: Dict[str, Any], doc_type: str, title: Optional[str] = None) -> str:
+    """Сообщение об успешном распознавании документа"""
+    default_title, number_label = DOCUMENT_RESULT_LABELS[doc_type]
+    title = title or default_title
+    return (
+        f"{title}\n"
+        f"👤 ФИО: {get_full_name(document_data, doc_type)}\n"
+        f"{number_label}: {get_document_number(document_data, doc_type)}\n"
+        f"Теперь отправьте голосовое сообщение с номером телефона и банком:"
+    )
+
+
+def result_keyboard() -> Optional[InlineKeyboardMarkup]:
+    """Inline-кнопка сохранения под распознанным документом (если хранилище включено)"""
+    if not document_store.enabled:
+        return None
+    return InlineKeyboardMarkup([[InlineKeyboardButton("💾 Запомнить документ", callback_data=SAVE_DOCUMENT_CALLBACK)]])
+
+
 def handle_photo(update: Update, context: CallbackContext) -> int:
     """Обработчик фото документов"""
     user_id = update.effective_user.id
-    session = get_session(user_id)
+    session = get_session(context, user_id)
     if not session:
-        update.message.reply_text("Сессия не найдена. Начните с /start")
+        reply(update, context, "Сессия не найдена. Начните с /start")
         return show_main_menu(update, context)
 
     doc_type = session.get("document_type")
 
-    # Получаем фото
-    photo_file = update.message.photo[-1].get_file()
-    photo_bytes = photo_file.download_as_bytearray()
-    image_base64 = base64.b64encode(bytes(photo_bytes)).decode('utf-8')
+    # Получаем фото и сразу отсекаем непригодные - до обращения к облаку
+    image_bytes, report = download_checked_photo(context.bot, update.message.photo[-1])
+    if not report.ok:
+        reply(update, context, format_quality_rejection(report))
+        return photo_state(session)
+    if report.warnings:
+        reply(update, context, f"⚠️ Внимание: {', '.join(report.warnings)}. Пробую распознать...")
+    image_base64 = encode_base64(image_bytes)
 
     if doc_type == DOCUMENT_PASSPORT:
         return handle_passport_photo(update, context, session, image_base64)
@@ -277,41 +647,21 @@ def handle_photo(update: Update, context: CallbackContext) -> int:
 
 def handle_passport_photo(update: Update, context: CallbackContext, session: Dict[str, Any], image_base64: str) -> int:
     """Обработка фото паспорта"""
-    update.message.reply_text("⌛ Распознаю паспорт...")
+    progress = start_progress(update, context, "⌛ Распознаю паспорт...")
 
     try:
-        response = requests.post(
-            PASSPORT_FUNCTION_URL,
-            json={"image": image_base64},
-            timeout=30,
-        )
-        response.raise_for_status()
-        payload = response.json()
+        payload = recognize_document(context, DOCUMENT_PASSPORT, [image_base64], update.effective_user.id)
 
         if not payload.get("success"):
             error_msg = payload.get("error") or payload.get("message", "Unknown error")
-            update.message.reply_text(f"❌ Ошибка: {error_msg}")
-            reply_markup = ReplyKeyboardMarkup([["📷 Сделать фото", "↪️ Назад в меню"]], resize_keyboard=True)
-            update.message.reply_text("Попробуйте снова:", reply_markup=reply_markup)
+            progress.finish(f"❌ Ошибка: {error_msg}\nПопробуйте снова:")
             return TAKING_PASSPORT_PHOTO
 
-        # Сохраняем данные
-        session["document_data"] = {
-            "last_name": payload.get("last_name", ""),
-            "first_name": payload.get("first_name", ""),
-            "middle_name": payload.get("middle_name", ""),
-            "passport_number": payload.get("passport_number", ""),
-        }
-
-        # Показываем результат
-        full_name = format_passport_name(session["document_data"])
-        passport_number = session["document_data"].get("passport_number", "")
-        reply_markup = ReplyKeyboardMarkup([["🎤 Отправить голосовое", "↪️ Назад в меню"]], resize_keyboard=True)
-        update.message.reply_text(
-            f"✅ Паспорт распознан!\n"
-            f"👤 ФИО: {full_name}\n"
-            f"📇 Номер: {passport_number}\n"
-            f"Теперь отправьте голосовое сообщение с номером телефона и банком:",
+        # Сохраняем данные и показываем результат
+        session["document_data"] = build_document_data(payload, DOCUMENT_PASSPORT)
+        reply_markup = result_keyboard()
+        progress.finish(
+            format_recognized_message(session["document_data"], DOCUMENT_PASSPORT),
             reply_markup=reply_markup
         )
 
@@ -319,11 +669,7 @@ def handle_passport_photo(update: Update, context: CallbackContext, session: Dic
 
     except Exception as e:
         logging.exception("Error processing passport")
-        reply_markup = ReplyKeyboardMarkup([["📷 Сделать фото", "↪️ Назад в меню"]], resize_keyboard=True)
-        update.message.reply_text(
-            f"❌ Ошибка: {str(e)}\nПопробуйте снова:",
-            reply_markup=reply_markup
-        )
+        progress.finish(f"❌ Ошибка: {str(e)}\nПопробуйте снова:")
         return TAKING_PASSPORT_PHOTO
 
 
@@ -334,53 +680,33 @@ def handle_license_photo(update: Update, context: CallbackContext, session: Dict
 
     if len(session["photos"]) == 1:
         # Первое фото - лицевая сторона
-        reply_markup = ReplyKeyboardMarkup([["📷 Сделать фото", "↪️ Назад в меню"]], resize_keyboard=True)
-        update.message.reply_text(
+        reply(
+            update, context,
             "✅ Лицевая сторона получена.\n"
-            "Теперь отправьте фото ОБРАТНОЙ стороны прав:",
-            reply_markup=reply_markup
+            "Теперь отправьте фото ОБРАТНОЙ стороны прав:"
         )
         return TAKING_LICENSE_BACK
 
     elif len(session["photos"]) == 2:
         # Второе фото - обратная сторона
-        update.message.reply_text("⌛ Распознаю водительские права...")
+        progress = start_progress(update, context, "⌛ Распознаю водительские права...")
 
         try:
-            response = requests.post(
-                LICENSE_FUNCTION_URL,
-                json={
-                    "front_image": session["photos"][0],
-                    "back_image": session["photos"][1]
-                },
-                timeout=30,
+            payload = recognize_document(
+                context, DOCUMENT_LICENSE, session["photos"], update.effective_user.id, PRIORITY_FOLLOWUP
             )
-            response.raise_for_status()
-            payload = response.json()
 
             if not payload.get("success"):
                 error_msg = payload.get("error") or payload.get("message", "Unknown error")
-                update.message.reply_text(f"❌ Ошибка: {error_msg}")
                 session["photos"] = []  # Сбрасываем фото
-                reply_markup = ReplyKeyboardMarkup([["📷 Сделать фото", "↪️ Назад в меню"]], resize_keyboard=True)
-                update.message.reply_text("Попробуйте снова:", reply_markup=reply_markup)
+                progress.finish(f"❌ Ошибка: {error_msg}\nПопробуйте снова:")
                 return TAKING_LICENSE_FRONT
 
-            # Сохраняем данные
-            session["document_data"] = {
-                "full_name": payload.get("full_name", ""),
-                "license_number": payload.get("license_number", ""),
-            }
-
-            # Показываем результат
-            full_name = session["document_data"].get("full_name", "")
-            license_number = session["document_data"].get("license_number", "")
-            reply_markup = ReplyKeyboardMarkup([["🎤 Отправить голосовое", "↪️ Назад в меню"]], resize_keyboard=True)
-            update.message.reply_text(
-                f"✅ Права распознаны!\n"
-                f"👤 ФИО: {full_name}\n"
-                f"🚗 Номер: {license_number}\n"
-                f"Теперь отправьте голосовое сообщение с номером телефона и банком:",
+            # Сохраняем данные и показываем результат
+            session["document_data"] = build_document_data(payload, DOCUMENT_LICENSE)
+            reply_markup = result_keyboard()
+            progress.finish(
+                format_recognized_message(session["document_data"], DOCUMENT_LICENSE),
                 reply_markup=reply_markup
             )
 
@@ -389,11 +715,7 @@ def handle_license_photo(update: Update, context: CallbackContext, session: Dict
         except Exception as e:
             logging.exception("Error processing license")
             session["photos"] = []  # Сбрасываем фото
-            reply_markup = ReplyKeyboardMarkup([["📷 Сделать фото", "↪️ Назад в меню"]], resize_keyboard=True)
-            update.message.reply_text(
-                f"❌ Ошибка: {str(e)}\nПопробуйте снова:",
-                reply_markup=reply_markup
-            )
+            progress.finish(f"❌ Ошибка: {str(e)}\nПопробуйте снова:")
             return TAKING_LICENSE_FRONT
 
     return TAKING_LICENSE_FRONT
@@ -401,39 +723,21 @@ def handle_license_photo(update: Update, context: CallbackContext, session: Dict
 
 def handle_patent_photo(update: Update, context: CallbackContext, session: Dict[str, Any], image_base64: str) -> int:
     """Обработка фото патента"""
-    update.message.reply_text("⌛ Распознаю патент...")
+    progress = start_progress(update, context, "⌛ Распознаю патент...")
 
     try:
-        response = requests.post(
-            PATENT_FUNCTION_URL,
-            json={"image": image_base64},
-            timeout=30,
-        )
-        response.raise_for_status()
-        payload = response.json()
+        payload = recognize_document(context, DOCUMENT_PATENT, [image_base64], update.effective_user.id)
 
         if not payload.get("success"):
             error_msg = payload.get("error") or payload.get("message", "Unknown error")
-            update.message.reply_text(f"❌ Ошибка: {error_msg}")
-            reply_markup = ReplyKeyboardMarkup([["📷 Сделать фото", "↪️ Назад в меню"]], resize_keyboard=True)
-            update.message.reply_text("Попробуйте снова:", reply_markup=reply_markup)
+            progress.finish(f"❌ Ошибка: {error_msg}\nПопробуйте снова:")
             return TAKING_PATENT_PHOTO
 
-        # Сохраняем данные
-        session["document_data"] = {
-            "full_name": payload.get("full_name", ""),
-            "document_number": payload.get("document_number", ""),
-        }
-
-        # Показываем результат
-        full_name = session["document_data"].get("full_name", "")
-        doc_number = session["document_data"].get("document_number", "")
-        reply_markup = ReplyKeyboardMarkup([["🎤 Отправить голосовое", "↪️ Назад в меню"]], resize_keyboard=True)
-        update.message.reply_text(
-            f"✅ Патент распознан!\n"
-            f"👤 ФИО: {full_name}\n"
-            f"📇 Номер: {doc_number}\n"
-            f"Теперь отправьте голосовое сообщение с номером телефона и банком:",
+        # Сохраняем данные и показываем результат
+        session["document_data"] = build_document_data(payload, DOCUMENT_PATENT)
+        reply_markup = result_keyboard()
+        progress.finish(
+            format_recognized_message(session["document_data"], DOCUMENT_PATENT),
             reply_markup=reply_markup
         )
 
@@ -441,45 +745,238 @@ def handle_patent_photo(update: Update, context: CallbackContext, session: Dict[
 
     except Exception as e:
         logging.exception("Error processing patent")
-        reply_markup = ReplyKeyboardMarkup([["📷 Сделать фото", "↪️ Назад в меню"]], resize_keyboard=True)
-        update.message.reply_text(
-            f"❌ Ошибка: {str(e)}\nПопробуйте снова:",
+        progress.finish(f"❌ Ошибка: {str(e)}\nПопробуйте снова:")
+        return TAKING_PATENT_PHOTO
+
+
+# ============================================================================
+# АЛЬБОМЫ (несколько фото одним сообщением)
+# ============================================================================
+
+class MediaGroupFilter(MessageFilter):
+    """Сообщения, входящие в альбом (media group)"""
+
+    def filter(self, message: Message) -> bool:
+        return bool(message.media_group_id)
+
+
+album_photo_filter = Filters.photo & MediaGroupFilter()
+
+
+def handle_album_photo(update: Update, context: CallbackContext) -> int:
+    """Собрать фото альбома; распознавание запускается после окна сборки"""
+    user_id = update.effective_user.id
+    session = get_session(context, user_id)
+    if not session or not session.get("document_type"):
+        reply(update, context, "Сессия не найдена. Начните с /start")
+        return show_main_menu(update, context)
+
+    message = update.message
+    album = session.get("album")
+    if not album or album["id"] != message.media_group_id:
+        # Первое фото нового альбома - ставим обработку через окно сборки
+        album = {"id": message.media_group_id, "photos": []}
+        session["album"] = album
+        session.pop("album_next_state", None)
+        context.job_queue.run_once(
+            process_album,
+            ALBUM_ASSEMBLY_WINDOW,
+            context={
+                "user_id": user_id,
+                "chat_id": update.effective_chat.id,
+                "album_id": message.media_group_id,
+            },
+        )
+    album["photos"].append((message.message_id, message.photo[-1]))
+    return PROCESSING_ALBUM
+
+
+def handle_after_album(update: Update, context: CallbackContext) -> int:
+    """
+    Сообщение в состоянии PROCESSING_ALBUM.
+
+    Альбом распознаётся в задаче JobQueue вне ConversationHandler, поэтому
+    шаг, на который перешёл пользователь (голосовое при успехе, фото при
+    ошибке), записывается в сессию. Пока альбом в работе, сообщение
+    отклоняется; после - передаётся обработчикам этого шага.
+    """
+    session = get_session(context, update.effective_user.id)
+    next_state = session.get("album_next_state") if session else None
+    if next_state is None:
+        reply(update, context, "⏳ Ещё обрабатываю альбом, подождите...")
+        return PROCESSING_ALBUM
+
+    del session["album_next_state"]
+    for handler in context.bot_data["conversation"].states[next_state]:
+        check = handler.check_update(update)
+        if check is not None and check is not False:
+            result = handler.callback(update, context)
+            return next_state if result is None else result
+    return next_state
+
+
+def recognize_first_success(context: CallbackContext, doc_type: str, images: List[str], user_id: int) -> Dict[str, Any]:
+    """Распознать несколько фото параллельно и взять первый успешный ответ"""
+    futures = [submit_recognition(context, doc_type, [image], user_id) for image in images]
+    payload: Dict[str, Any] = {}
+    try:
+        for future in as_completed(futures):
+            try:
+                payload = future.result()
+            except Exception as e:
+                logging.warning("Album photo recognition failed: %s", e)
+                payload = {"error": str(e)}
+                continue
+            if payload.get("success"):
+                return payload
+        return payload
+    finally:
+        # Ещё не начатые распознавания остальных фото больше не нужны
+        for future in futures:
+            future.cancel()
+
+
+def process_album(context: CallbackContext) -> None:
+    """Распознать альбом и запомнить шаг, на который перешёл пользователь"""
+    job_context = context.job.context
+    session = get_session(context, job_context["user_id"])
+    album = session.pop("album", None) if session else None
+    if not album or album["id"] != job_context["album_id"]:
+        return
+    # Следующее сообщение пользователя handle_after_album передаст
+    # обработчикам этого шага
+    try:
+        next_state = recognize_album(context, session, album)
+    except Exception:
+        logging.exception("Error processing album")
+        if not is_current_session(context, job_context["user_id"], session):
+            return
+        get_outbound(context).send(job_context["chat_id"], "❌ Не удалось обработать альбом. Отправьте фото снова:")
+        next_state = photo_state(session)
+    # Пользователь мог вернуться в меню, пока альбом распознавался
+    if next_state is not None:
+        session["album_next_state"] = next_state
+
+
+def recognize_album(context: CallbackContext, session: Dict[str, Any], album: Dict[str, Any]) -> Optional[int]:
+    """
+    Скачать фото альбома параллельно, распознать документ и вернуть следующий шаг.
+
+    Если за это время пользователь вернулся в меню или отменил действие
+    (сессия сменилась), результат не показывается и шаг не возвращается.
+    """
+    job_context = context.job.context
+    chat_id = job_context["chat_id"]
+    user_id = job_context["user_id"]
+    doc_type = session["document_type"]
+    outbound = get_outbound(context)
+    photos = [photo for _, photo in sorted(album["photos"], key=lambda item: item[0])]
+
+    # Скачиваем и проверяем качество параллельно, непригодные фото отбрасываем
+    checked = list(io_executor.map(download_checked_photo, [context.bot] * len(photos), photos))
+    rejected = [report for _, report in checked if not report.ok]
+    accepted = [encode_base64(data) for data, report in checked if report.ok]
+    if not is_current_session(context, user_id, session):
+        return None
+    if rejected:
+        outbound.send(chat_id, format_quality_rejection(rejected[0]))
+    if not accepted and doc_type != DOCUMENT_LICENSE:
+        return photo_state(session)
+
+    if doc_type == DOCUMENT_LICENSE:
+        images = session.get("photos", []) + accepted
+        if not images:
+            return TAKING_LICENSE_FRONT
+        if len(images) < 2:
+            session["photos"] = images
+            outbound.send(
+                chat_id,
+                "✅ Лицевая сторона получена.\n"
+                "Теперь отправьте фото ОБРАТНОЙ стороны прав:"
+            )
+            return TAKING_LICENSE_BACK
+        images = images[:2]
+        session["photos"] = []
+        progress = outbound.progress(chat_id, "⌛ Распознаю водительские права...")
+    else:
+        progress = outbound.progress(chat_id, "⌛ Распознаю документ...")
+        images = accepted
+
+    try:
+        if doc_type == DOCUMENT_LICENSE:
+            payload = recognize_document(context, doc_type, images, user_id, PRIORITY_FOLLOWUP)
+        else:
+            payload = recognize_first_success(context, doc_type, images, user_id)
+
+        if not is_current_session(context, user_id, session):
+            progress.finish("↪️ Распознавание отменено.")
+            return None
+
+        if not payload.get("success"):
+            error_msg = payload.get("error") or payload.get("message", "Unknown error")
+            progress.finish(f"❌ Ошибка: {error_msg}\nПопробуйте снова:")
+            return photo_state(session)
+
+        session["document_data"] = build_document_data(payload, doc_type)
+        reply_markup = result_keyboard()
+        progress.finish(
+            format_recognized_message(session["document_data"], doc_type),
             reply_markup=reply_markup
         )
-        return TAKING_PATENT_PHOTO
+        return TAKING_VOICE
+
+    except Exception as e:
+        logging.exception("Error processing album")
+        if not is_current_session(context, user_id, session):
+            progress.finish("↪️ Распознавание отменено.")
+            return None
+        progress.finish(f"❌ Ошибка: {str(e)}\nПопробуйте снова:")
+        return photo_state(session)
 
 
 def handle_voice(update: Update, context: CallbackContext) -> int:
     """Обработчик голосовых сообщений"""
     user_id = update.effective_user.id
-    session = get_session(user_id)
+    session = get_session(context, user_id)
 
     if not session or not session.get("document_data"):
-        update.message.reply_text("Сначала отправьте документ.")
+        reply(update, context, "Сначала отправьте документ.")
         return show_main_menu(update, context)
 
-    update.message.reply_text("⌛ Распознаю голосовое сообщение...")
+    progress = start_progress(update, context, "⌛ Распознаю голосовое сообщение...")
 
     try:
-        # Получаем голосовое
-        voice_file = update.message.voice.get_file()
-        audio_bytes = voice_file.download_as_bytearray()
-        audio_base64 = base64.b64encode(bytes(audio_bytes)).decode('utf-8')
-
-        # Отправляем в аудио функцию
-        response = requests.post(
-            AUDIO_FUNCTION_URL,
-            json={"audio": audio_base64},
-            timeout=30,
-        )
-        response.raise_for_status()
-        payload = response.json()
+        # Получаем голосовое и отправляем в аудио функцию
+        audio_base64 = download_as_base64(context.bot, update.message.voice.file_id)
+        audio_pool = get_tenant(context).endpoints.pool(FUNCTION_AUDIO)
+        if AUDIO_STREAMING:
+            last_update = [0.0]
+
+            def show_partial(text: str) -> None:
+                # Вызывается в потоке очереди распознавания: промежуточный
+                # текст необязателен, поэтому edit не ждёт лимитов, а его
+                # ошибки не должны прерывать распознавание
+                now = time.monotonic()
+                if not text or now - last_update[0] < PARTIAL_UPDATE_INTERVAL:
+                    return
+                try:
+                    if progress.try_update(f"🎙 Слышу: «{text}»..."):
+                        last_update[0] = now
+                except TelegramError as e:
+                    logging.warning("Could not show partial transcript: %s", e)
+
+            payload = submit_call(
+                context, PRIORITY_FINAL, user_id, stream_function,
+                audio_pool, {"audio": audio_base64}, show_partial,
+            ).result()
+        else:
+            payload = submit_call(
+                context, PRIORITY_FINAL, user_id, call_function, audio_pool, {"audio": audio_base64}
+            ).result()
 
         if not payload.get("success"):
             error_msg = payload.get("error") or payload.get("message", "Unknown error")
-            update.message.reply_text(f"❌ Ошибка: {error_msg}")
-            reply_markup = ReplyKeyboardMarkup([["🎤 Отправить голосовое", "↪️ Назад в меню"]], resize_keyboard=True)
-            update.message.reply_text("Попробуйте снова:", reply_markup=reply_markup)
+            progress.finish(f"❌ Ошибка: {error_msg}\nПопробуйте снова:")
             return TAKING_VOICE
 
         # Получаем данные
@@ -501,41 +998,98 @@ def handle_voice(update: Update, context: CallbackContext) -> int:
             "document_type": doc_type,
         }
 
-        # Отправляем результат
+        # Результат - на месте сообщения о прогрессе, затем главное меню
         pretty = json.dumps(final_result, ensure_ascii=False, indent=2)
-        update.message.reply_text(
-            f"🎉 Готово! Итоговый JSON:\n```json\n{pretty}\n```",
+        progress.finish(
+            f"🎉 Готово! Итоговый JSON:\n```json\n{pretty}\n```\n"
+            "✅ Обработка завершена!",
             parse_mode=ParseMode.MARKDOWN,
         )
-
-        # Показываем меню для нового действия
-        reply_markup = ReplyKeyboardMarkup(MAIN_MENU_KEYBOARD, resize_keyboard=True)
-        update.message.reply_text(
-            "✅ Обработка завершена!\n"
-            "Выберите следующее действие:",
-            reply_markup=reply_markup
-        )
+        reply(update, context, "Выберите следующее действие:", reply_markup=main_menu_keyboard(context))
 
         # Сбрасываем сессию
-        end_session(user_id)
-        create_session(user_id)
+        end_session(context, user_id)
+        create_session(context, user_id)
 
         return SELECTING_ACTION
 
     except Exception as e:
         logging.exception("Error processing voice")
-        reply_markup = ReplyKeyboardMarkup([["🎤 Отправить голосовое", "↪️ Назад в меню"]], resize_keyboard=True)
-        update.message.reply_text(
-            f"❌ Ошибка: {str(e)}\nПопробуйте снова:",
-            reply_markup=reply_markup
-        )
+        progress.finish(f"❌ Ошибка: {str(e)}\nПопробуйте снова:")
         return TAKING_VOICE
 
 
+# ============================================================================
+# СОХРАНЁННЫЕ ДОКУМЕНТЫ
+# ============================================================================
+
+def use_saved_document(update: Update, context: CallbackContext) -> int:
+    """Взять сохранённый документ вместо фото и сразу перейти к голосовому"""
+    user_id = update.effective_user.id
+    session = get_session(context, user_id)
+    doc_type = session.get("document_type") if session else None
+    document_data = document_store.load(get_tenant(context).name, user_id, doc_type) if doc_type else None
+    if not document_data:
+        reply(update, context, "Сохранённый документ не найден или срок его хранения истёк. Отправьте фото:")
+        return photo_state(session) if session else SELECTING_ACTION
+
+    session["document_data"] = document_data
+    reply(
+        update, context,
+        format_recognized_message(document_data, doc_type, title="📂 Использую сохранённый документ"),
+    )
+    return TAKING_VOICE
+
+
+def handle_save_button(update: Update, context: CallbackContext) -> None:
+    """Inline-кнопка "💾 Запомнить документ" под результатом распознавания"""
+    update.callback_query.answer()
+    save_document(update, context)
+
+
+def save_document(update: Update, context: CallbackContext) -> int:
+    """Сохранить распознанный документ по просьбе пользователя"""
+    user_id = update.effective_user.id
+    session = get_session(context, user_id)
+    if not session or not session.get("document_data"):
+        reply(update, context, "Документ ещё не распознан.")
+        return photo_state(session) if session else SELECTING_ACTION
+
+    if document_store.save(get_tenant(context).name, user_id, session["document_type"], session["document_data"]):
+        reply(
+            update, context,
+            f"💾 Документ сохранён на {DOCUMENT_STORE_TTL_DAYS:.0f} дн. В следующий раз выберите "
+            "'📂 Использовать сохранённый' вместо фото. Удалить: /forget\n"
+            "Теперь отправьте голосовое сообщение с номером телефона и банком:"
+        )
+    else:
+        reply(update, context, "Сохранение документов недоступно.")
+    return TAKING_VOICE
+
+
+def forget_command(update: Update, context: CallbackContext) -> None:
+    """Обработчик команды /forget: удалить сохранённые документы пользователя"""
+    removed = document_store.forget(get_tenant(context).name, update.effective_user.id)
+    if removed:
+        reply(update, context, "🗑 Сохранённые документы удалены.")
+    else:
+        reply(update, context, "Сохранённых документов нет.")
+
+
+def purge_saved_documents(context: CallbackContext) -> None:
+    """Периодически удалять документы с истёкшим сроком"""
+    document_store.purge_expired()
+
+
 # ============================================================================
 # ОБРАБОТЧИК ТЕКСТА (резервный)
 # ============================================================================
 
+def handle_busy(update: Update, context: CallbackContext) -> None:
+    """Сообщение пришло, пока предыдущее ещё обрабатывается"""
+    reply(update, context, "⏳ Ещё обрабатываю предыдущее сообщение, подождите...")
+
+
 def handle_text(update: Update, context: CallbackContext) -> int:
     """Обработчик текстовых сообщений"""
     text = update.message.text
@@ -547,8 +1101,9 @@ def handle_text(update: Update, context: CallbackContext) -> int:
         return show_main_menu(update, context)
 
     # Если пользователь ввел текст вместо кнопки
-    reply_markup = ReplyKeyboardMarkup(MAIN_MENU_KEYBOARD, resize_keyboard=True)
-    update.message.reply_text(
+    reply_markup = main_menu_keyboard(context)
+    reply(
+        update, context,
         "Пожалуйста, используйте кнопки меню:",
         reply_markup=reply_markup
     )
@@ -556,21 +1111,81 @@ def handle_text(update: Update, context: CallbackContext) -> int:
 
 
 # ============================================================================
-# ОСНОВНАЯ ФУНКЦИЯ
+# ПРОФИЛИРОВАНИЕ (только для администраторов)
 # ============================================================================
 
-def main() -> None:
-    """Основная функция запуска бота"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    )
+def profile_command(update: Update, context: CallbackContext) -> None:
+    """Обработчик команды /profile [секунды]"""
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        return
 
-    updater = Updater(TELEGRAM_BOT_TOKEN, use_context=True)
-    dispatcher = updater.dispatcher
+    try:
+        seconds = float(context.args[0]) if context.args else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        reply(update, context, "Использование: /profile [секунды]")
+        return
+    seconds = min(max(seconds, 1), PROFILE_MAX_SECONDS)
+
+    chat_id = update.effective_chat.id
+    outbound = get_outbound(context)
+
+    def on_done(paths: List[str]) -> None:
+        if paths:
+            outbound.send(chat_id, "📊 Профилирование завершено:\n" + "\n".join(paths))
+        else:
+            outbound.send(chat_id, "❌ Не удалось сохранить результаты профилирования.")
+
+    if not runtime_profiler.start(seconds, on_done):
+        reply(update, context, "⏳ Профилирование уже идёт.")
+        return
+    reply(update, context, f"📊 Профилирование включено на {seconds:.0f} с.")
+
+
+def stats_command(update: Update, context: CallbackContext) -> None:
+    """Обработчик команды /stats: очередь распознавания по классам приоритета"""
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        return
+
+    lines = ["📈 Очередь распознавания:"]
+    for name, stats in recognition_scheduler.stats().items():
+        lines.append(
+            f"{name}: в очереди {stats['queued']}, выполнено {stats['completed']}, "
+            f"ожидание p50 {stats['wait_p50']:.2f} с, p99 {stats['wait_p99']:.2f} с"
+        )
+
+    for tenant in tenants.values():
+        lines.append("")
+        quota = tenant.max_pending or "∞"
+        lines.append(f"🤖 {tenant.name}: запросов {tenant.pending}/{quota}, вес {tenant.weight:g}")
+        for name, pool in tenant.endpoints.pools.items():
+            for endpoint in pool.stats():
+                latency = endpoint["ewma_latency"]
+                lines.append(
+                    f"{name}: {'✅' if endpoint['healthy'] else '⛔'} {endpoint['url']} — "
+                    f"в работе {endpoint['outstanding']}, "
+                    f"задержка {f'{latency:.2f} с' if latency is not None else 'нет данных'}"
+                )
+    reply(update, context, "\n".join(lines))
+
+
+def handle_profile_signal(signum: int, frame: Any) -> None:
+    """Включить профилирование по сигналу SIGUSR1"""
+    runtime_profiler.start(PROFILE_DEFAULT_SECONDS)
 
-    # Создаем ConversationHandler для управления состояниями
-    conv_handler = ConversationHandler(
+
+def handle_reload_signal(signum: int, frame: Any) -> None:
+    """Перечитать файлы адресов функций по сигналу SIGHUP"""
+    for tenant in tenants.values():
+        tenant.endpoints.reload()
+
+
+# ============================================================================
+# ОСНОВНАЯ ФУНКЦИЯ
+# ============================================================================
+
+def build_conversation_handler() -> ConversationHandler:
+    """ConversationHandler для управления состояниями (у каждого бота свой)"""
+    return ConversationHandler(
         entry_points=[CommandHandler('start', start_command)],
         states={
             SELECTING_ACTION: [
@@ -579,30 +1194,45 @@ def main() -> None:
                 MessageHandler(Filters.text & ~Filters.command, handle_text),
             ],
             TAKING_PASSPORT_PHOTO: [
-                MessageHandler(Filters.photo, handle_photo),
-                MessageHandler(Filters.regex('^(↪️ Назад в меню|📷 Сделать фото)$'), handle_document_menu_selection),
+                MessageHandler(album_photo_filter, handle_album_photo),
+                MessageHandler(Filters.photo, handle_photo, run_async=True),
+                MessageHandler(Filters.regex(DOCUMENT_MENU_PATTERN), handle_document_menu_selection),
                 MessageHandler(Filters.text & ~Filters.command, handle_text),
             ],
             TAKING_LICENSE_FRONT: [
-                MessageHandler(Filters.photo, handle_photo),
-                MessageHandler(Filters.regex('^(↪️ Назад в меню|📷 Сделать фото)$'), handle_document_menu_selection),
+                MessageHandler(album_photo_filter, handle_album_photo),
+                MessageHandler(Filters.photo, handle_photo, run_async=True),
+                MessageHandler(Filters.regex(DOCUMENT_MENU_PATTERN), handle_document_menu_selection),
                 MessageHandler(Filters.text & ~Filters.command, handle_text),
             ],
             TAKING_LICENSE_BACK: [
-                MessageHandler(Filters.photo, handle_photo),
-                MessageHandler(Filters.regex('^(↪️ Назад в меню|📷 Сделать фото)$'), handle_document_menu_selection),
+                MessageHandler(album_photo_filter, handle_album_photo),
+                MessageHandler(Filters.photo, handle_photo, run_async=True),
+                MessageHandler(Filters.regex(DOCUMENT_MENU_PATTERN), handle_document_menu_selection),
                 MessageHandler(Filters.text & ~Filters.command, handle_text),
             ],
             TAKING_PATENT_PHOTO: [
-                MessageHandler(Filters.photo, handle_photo),
-                MessageHandler(Filters.regex('^(↪️ Назад в меню|📷 Сделать фото)$'), handle_document_menu_selection),
+                MessageHandler(album_photo_filter, handle_album_photo),
+                MessageHandler(Filters.photo, handle_photo, run_async=True),
+                MessageHandler(Filters.regex(DOCUMENT_MENU_PATTERN), handle_document_menu_selection),
                 MessageHandler(Filters.text & ~Filters.command, handle_text),
             ],
             TAKING_VOICE: [
-                MessageHandler(Filters.voice, handle_voice),
-                MessageHandler(Filters.regex('^(↪️ Назад в меню|🎤 Отправить голосовое)$'), handle_document_menu_selection),
+                MessageHandler(Filters.voice, handle_voice, run_async=True),
+                MessageHandler(Filters.regex(DOCUMENT_MENU_PATTERN), handle_document_menu_selection),
                 MessageHandler(Filters.text & ~Filters.command, handle_text),
             ],
+            # Альбом распознаётся в фоне: остальные фото альбома собираем,
+            # прочее передаём шагу, которым закончилось распознавание
+            PROCESSING_ALBUM: [
+                MessageHandler(album_photo_filter, handle_album_photo),
+                MessageHandler(Filters.regex('^↪️ Назад в меню$'), handle_document_menu_selection),
+                MessageHandler(Filters.all & ~Filters.command, handle_after_album, run_async=True),
+            ],
+            # Пока предыдущее фото/голосовое этого пользователя в обработке
+            ConversationHandler.WAITING: [
+                MessageHandler(Filters.all & ~Filters.command, handle_busy),
+            ],
         },
         fallbacks=[
             CommandHandler('cancel', cancel_command),
@@ -611,28 +1241,73 @@ def main() -> None:
         ],
     )
 
-    dispatcher.add_handler(conv_handler)
+
+def create_updater(tenant: Tenant, request: Request, workers: int) -> Updater:
+    """Updater одного бота: свои обработчики и лимиты отправки, общие пулы"""
+    # Фото и голосовые обрабатываются в пуле потоков диспетчера, а порядок
+    # обращений к функциям распознавания определяет recognition_scheduler
+    updater = Updater(bot=Bot(tenant.token, request=request), use_context=True, workers=workers)
+    dispatcher = updater.dispatcher
+    dispatcher.bot_data["tenant"] = tenant
+    dispatcher.bot_data["outbound"] = OutboundMessenger(updater.bot)
+
+    conversation = build_conversation_handler()
+    dispatcher.bot_data["conversation"] = conversation
+    dispatcher.add_handler(conversation)
+    dispatcher.add_handler(CommandHandler('profile', profile_command))
+    dispatcher.add_handler(CommandHandler('stats', stats_command))
+    dispatcher.add_handler(CommandHandler('forget', forget_command))
+    dispatcher.add_handler(CallbackQueryHandler(handle_save_button, pattern=f"^{SAVE_DOCUMENT_CALLBACK}$"))
+    return updater
+
+
+def main() -> None:
+    """Основная функция запуска бота"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    # Потоки обработчиков делятся между ботами, а соединения с Telegram
+    # (long polling, ответы, скачивание файлов) идут через один общий пул
+    workers = max(DISPATCHER_WORKERS // len(tenants), MIN_BOT_WORKERS)
+    request = Request(con_pool_size=len(tenants) * (workers + SENDER_WORKERS + 4) + IO_WORKERS)
+    updaters = [create_updater(tenant, request, workers) for tenant in tenants.values()]
+
+    if document_store.enabled:
+        updaters[0].job_queue.run_repeating(purge_saved_documents, interval=3600, first=3600)
+
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, handle_profile_signal)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, handle_reload_signal)
+
+    # Проверка выведенных из ротации адресов и отслеживание файлов адресов
+    start_health_checks([tenant.endpoints for tenant in tenants.values()])
 
     # Выводим информацию о запуске
     print("=" * 60)
     print("🤖 БОТ С КНОПОЧНЫМ МЕНЮ")
     print("=" * 60)
-    print("📋 Доступные документы:")
-    print("  📄 Паспорт")
-    print("  🚗 Водительские права")
-    print("  📋 Патент на работу")
-    print("")
-    print("🔗 Функции:")
-    print(f"  Паспорт: {PASSPORT_FUNCTION_URL}")
-    print(f"  Права:   {LICENSE_FUNCTION_URL}")
-    print(f"  Патент:  {PATENT_FUNCTION_URL}")
-    print(f"  Аудио:   {AUDIO_FUNCTION_URL}")
+    for tenant in tenants.values():
+        print(f"📋 {tenant.name}: " + ", ".join(DOCUMENT_MENU_BUTTONS[doc_type] for doc_type in tenant.document_types))
+        print("🔗 Функции:")
+        for name in (*tenant.document_types, FUNCTION_AUDIO):
+            print(f"  {name}: {', '.join(tenant.endpoints.pool(name).urls)}")
+        print("")
     print("=" * 60)
     print("✅ Бот запущен и готов к работе!")
     print("=" * 60)
 
-    updater.start_polling()
-    updater.idle()
+    for updater in updaters:
+        updater.start_polling()
+    # idle() ждёт SIGINT/SIGTERM и останавливает первого бота, затем остальных
+    updaters[0].idle()
+    for updater in updaters[1:]:
+        updater.stop()
+    # Дослать сообщения, оставшиеся в очередях отправки
+    for updater in updaters:
+        updater.dispatcher.bot_data["outbound"].shutdown(timeout=10)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,127 @@
+"""
+Несколько ботов (брендов) в одном процессе.
+
+Каждый бот — свой токен, свой набор документов и свои адреса функций.
+Пулы потоков, очередь распознавания, HTTP-соединения и хранилища общие;
+изоляция между ботами — через вес в очереди распознавания и лимит
+одновременных запросов (max_pending).
+
+Конфигурация задаётся JSON-файлом:
+
+    {
+      "bots": [
+        {
+          "name": "brand-a",
+          "token_env": "BRAND_A_TOKEN",
+          "documents": ["passport", "patent"],
+          "functions": {"passport": ["https://..."], "audio": ["https://..."]},
+          "endpoints_file": "brand-a-endpoints.json",
+          "weight": 2,
+          "max_pending": 20
+        }
+      ]
+    }
+
+Токен можно указать прямо ("token") или именем переменной окружения
+("token_env"). Адрес функции можно задать строкой или списком строк.
+Функции, не указанные в "functions" (или с некорректным значением), берут
+адреса по умолчанию (из *_FUNCTION_URL).
+"""
+
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from endpoints import EndpointRegistry, config_urls
+
+DEFAULT_TENANT = "default"
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaExceeded(Exception):
+    """У бота исчерпан лимит одновременных запросов на распознавание"""
+
+
+@dataclass
+class Tenant:
+    name: str
+    token: str
+    document_types: Tuple[str, ...]
+    endpoints: EndpointRegistry
+    weight: float = 1.0
+    max_pending: int = 0  # 0 - без ограничения
+    pending: int = field(default=0, init=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def acquire(self) -> None:
+        """Занять место в квоте бота или выбросить QuotaExceeded"""
+        with self._lock:
+            if self.max_pending and self.pending >= self.max_pending:
+                raise QuotaExceeded("Сервис перегружен, попробуйте через минуту")
+            self.pending += 1
+
+    def release(self) -> None:
+        with self._lock:
+            self.pending -= 1
+
+
+def load_tenants(
+    path: Optional[str],
+    default_token: str,
+    document_types: Sequence[str],
+    default_urls: Dict[str, List[str]],
+    default_endpoints_file: Optional[str] = None,
+) -> List[Tenant]:
+    """Боты из файла конфигурации или один бот из переменных окружения"""
+    if not path:
+        return [
+            Tenant(
+                name=DEFAULT_TENANT,
+                token=default_token,
+                document_types=tuple(document_types),
+                endpoints=EndpointRegistry(default_urls, default_endpoints_file),
+            )
+        ]
+
+    with open(path, encoding="utf-8") as fh:
+        config = json.load(fh)
+
+    tenants = []
+    for entry in config.get("bots", []):
+        name = entry.get("name")
+        token = entry.get("token") or os.getenv(entry.get("token_env", ""), "")
+        if not name or not token:
+            raise ValueError(f"Bot entry needs a name and a token: {entry.get('name')!r}")
+        if any(tenant.name == name for tenant in tenants):
+            raise ValueError(f"Duplicate bot name: {name}")
+
+        documents = tuple(entry.get("documents") or document_types)
+        unknown = set(documents) - set(document_types)
+        if unknown:
+            raise ValueError(f"Unknown document types for {name}: {', '.join(sorted(unknown))}")
+
+        urls = dict(default_urls)
+        for function, value in (entry.get("functions") or {}).items():
+            parsed = config_urls(value)
+            if parsed is None:
+                logger.error("Invalid %s URLs for bot %s: %r, using defaults", function, name, value)
+                continue
+            urls[function] = parsed
+        tenants.append(
+            Tenant(
+                name=name,
+                token=token,
+                document_types=documents,
+                endpoints=EndpointRegistry(urls, entry.get("endpoints_file")),
+                weight=float(entry.get("weight", 1.0)),
+                max_pending=int(entry.get("max_pending", 0)),
+            )
+        )
+
+    if not tenants:
+        raise ValueError(f"No bots configured in {path}")
+    return tenants
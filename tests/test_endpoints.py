@@ -0,0 +1,46 @@
+import json
+
+from endpoints import EndpointRegistry, config_urls
+from tenants import load_tenants
+
+DEFAULTS = {"passport": ["https://default"], "audio": ["https://audio"]}
+
+
+def test_config_urls_accepts_string_and_list():
+    assert config_urls("https://a") == ["https://a"]
+    assert config_urls(["https://a", " https://b "]) == ["https://a", "https://b"]
+
+
+def test_config_urls_rejects_bad_values():
+    for value in ([], "", [""], ["https://a", 1], {"url": "https://a"}, 42):
+        assert config_urls(value) is None
+
+
+def test_reload_string_is_single_url(tmp_path):
+    path = tmp_path / "endpoints.json"
+    path.write_text(json.dumps({"passport": "https://a"}))
+    registry = EndpointRegistry(DEFAULTS, str(path))
+    assert registry.pool("passport").urls == ["https://a"]
+
+
+def test_reload_keeps_current_urls_on_bad_value(tmp_path):
+    path = tmp_path / "endpoints.json"
+    path.write_text(json.dumps({"passport": ["https://a", "https://b"]}))
+    registry = EndpointRegistry(DEFAULTS, str(path))
+
+    path.write_text(json.dumps({"passport": [123], "audio": {}}))
+    registry.reload()
+    assert registry.pool("passport").urls == ["https://a", "https://b"]
+    assert registry.pool("audio").urls == ["https://audio"]
+
+
+def test_tenant_functions_string_and_bad_value(tmp_path):
+    path = tmp_path / "bots.json"
+    path.write_text(json.dumps({"bots": [{
+        "name": "brand-a",
+        "token": "123:abc",
+        "functions": {"passport": "https://a", "audio": []},
+    }]}))
+    tenant, = load_tenants(str(path), "", ["passport"], DEFAULTS)
+    assert tenant.endpoints.pool("passport").urls == ["https://a"]
+    assert tenant.endpoints.pool("audio").urls == ["https://audio"]
@@ -0,0 +1,62 @@
+import random
+from io import BytesIO
+
+import pytest
+
+PIL = pytest.importorskip("PIL")
+from PIL import Image, ImageDraw, ImageFilter  # noqa: E402
+
+from image_quality import assess_image  # noqa: E402
+
+
+def encode(image: Image.Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def document_page(background: int, text: int) -> Image.Image:
+    """Страница со "строками текста" на ровном фоне"""
+    rng = random.Random(1)
+    image = Image.new("L", (1200, 900), background)
+    draw = ImageDraw.Draw(image)
+    for top in range(80, 820, 60):
+        left = 80
+        while left < 1100:
+            width = rng.randint(15, 60)
+            draw.rectangle((left, top + rng.randint(0, 4), left + width, top + 14), fill=text)
+            left += width + rng.randint(8, 20)
+    return image
+
+
+def test_light_scan_is_accepted():
+    report = assess_image(encode(document_page(background=240, text=30)))
+    assert report.ok, report.problems
+    assert report.metrics["brightness"] > 200
+
+
+def test_white_page_with_black_text_is_accepted():
+    report = assess_image(encode(document_page(background=255, text=0)))
+    assert report.ok, report.problems
+
+
+def test_bright_page_is_only_a_warning():
+    report = assess_image(encode(document_page(background=250, text=120)))
+    assert report.metrics["brightness"] > 225
+    assert report.ok, report.problems
+
+
+def test_washed_out_photo_is_rejected():
+    page = document_page(background=255, text=248).filter(ImageFilter.GaussianBlur(3))
+    report = assess_image(encode(page))
+    assert "фото пересвечено" in report.problems
+
+
+def test_dark_photo_is_rejected():
+    report = assess_image(encode(document_page(background=20, text=0)))
+    assert "фото слишком тёмное" in report.problems
+
+
+def test_unsupported_format_is_rejected():
+    report = assess_image(b"RIFF" + b"\0" * 20000)
+    assert not report.ok